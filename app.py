@@ -8,14 +8,24 @@ from flask import (
     session,
     jsonify,
     abort,
+    Response,
+    g,
 )
 
+import click
 import hashlib
-from database import DBhandler
+import json
+import config as app_config
+from database import LazyDBhandler, METRICS, request_db_stats
+import metrics as db_metrics
+from async_db import AsyncDBhandler, run_async, run_blocking
+from fragments import FragmentCache, render_block
+from assets import StaticAssets
+from images import ImageProcessor
+from uploads import CONTENT_NAME, UploadError, remove_image, save_image, save_images
 import os
-import uuid
-from werkzeug.utils import secure_filename
 import sys
+import time
 import datetime
 from datetime import datetime as dt, timezone
 from flask import abort
@@ -24,11 +34,102 @@ from flask import jsonify
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = "some-secret"
+# 요청 본문 전체 크기 제한 (넘으면 본문을 다 받기 전에 413)
+app.config["MAX_CONTENT_LENGTH"] = app_config.MAX_REQUEST_BYTES
+
+# 정적 파일: url_for 에 내용 해시(?v=) 를 붙이고 오래 캐시, 미리 압축한 파일 사용
+ASSETS = StaticAssets(app.static_folder)
+ASSETS.init_app(app)
 
 UPLOAD_FOLDER = os.path.join(app.root_path, "static", "images")
 
 
-DB = DBhandler()
+# 상품 삭제/대화 정리 등으로 마지막 참조가 사라진 이미지 파일(과 크기별 사본)을 지운다
+# 방금 올라왔거나 재사용된 파일은 남겨 둔다 (config.IMAGE_GC_GRACE, uploads.py 참고)
+def release_image_files(paths):
+    removed = []
+    for path in paths:
+        if not remove_image(app.static_folder, path, min_age=app_config.IMAGE_GC_GRACE):
+            continue
+        removed.append(path)
+        if path.startswith("images/"):
+            IMAGES.remove_variants(os.path.basename(path))
+    return removed
+
+
+# 처음 쓸 때 연결한다 (import 만으로는 자격 증명 파일도 읽지 않음)
+DB = LazyDBhandler(on_images_released=release_image_files)
+# async 뷰용: 서로 관계없는 읽기를 await ADB.gather(...) 로 동시에 보낸다
+ADB = AsyncDBhandler(DB, workers=app_config.ASYNC_DB_WORKERS)
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+if _gevent_patched():
+    # gevent 워커: 한 스레드에 요청이 여럿이라 요청마다 이벤트 루프를 띄울 수 없다
+    app.async_to_sync = run_blocking
+else:
+    try:
+        import asgiref  # noqa: F401  (pip install "flask[async]")
+    except ImportError:
+        # asgiref 가 없으면 async 뷰를 요청마다 asyncio.run 으로 실행
+        app.async_to_sync = run_async
+
+# 목록/리뷰/찜 페이지 본문 HTML 캐시
+FRAGMENTS = FragmentCache(max_bytes=app_config.FRAGMENT_CACHE_BYTES)
+
+
+def render_cached(template_name, key, build, public=False):
+    """template 의 title/content 블록을 key 로 캐시해서 렌더링
+
+    build() 는 템플릿 변수 dict 를 만드는 함수로, 캐시에 없을 때만 불린다
+    (DB 읽기도 그때만). public 이면 로그인하지 않은 요청은 페이지 전체를 캐시한다.
+
+    크기별 사본을 아직 만드는 중이라 원본 URL 이 들어간 HTML 은 캐시하지 않는다
+    (사본이 생겨도 데이터 버전은 안 바뀌므로 계속 원본을 내보내게 된다).
+    """
+    anonymous = public and "id" not in session
+    if anonymous:
+        page = FRAGMENTS.get(("page",) + key)
+        if page is not None:
+            return page
+
+    pending = False
+    blocks = FRAGMENTS.get(key)
+    if blocks is None:
+        g._images_pending = False
+        context = build()
+        blocks = (
+            render_block(template_name, "title", **context),
+            render_block(template_name, "content", **dict(context)),
+        )
+        pending = g.pop("_images_pending", False)
+        if not pending:
+            FRAGMENTS.set(key, blocks)
+
+    page = render_template("cached_page.html", cached_title=blocks[0], cached_content=blocks[1])
+    if anonymous and not pending:
+        FRAGMENTS.set(("page",) + key, page)
+    return page
+
+# 업로드 이미지의 thumb/card/full 사본을 백그라운드에서 만든다
+IMAGES = ImageProcessor(UPLOAD_FOLDER, workers=app_config.IMAGE_WORKERS)
+
+
+# 템플릿용: 크기별 사본이 있으면 사본 URL, 아직 없으면 원본 URL
+#   {{ image_url(value.img_path, "card") }}
+@app.template_global()
+def image_url(filename, variant="card"):
+    path = IMAGES.url_path(filename, variant)
+    if path == filename and IMAGES.pending(filename):
+        g._images_pending = True  # render_cached 가 이 HTML 은 캐시하지 않는다
+    return url_for("static", filename="images/" + (path or ""))
 
 # 더미 상품 (이미지 파일은 static/images/ 에 저장)
 PRODUCTS = [
@@ -69,6 +170,89 @@ def current_user_id():
     return session.get('id')  # 로그인 시 세션에 넣는 값 그대로 (추가)
 
 
+# 업로드가 MAX_CONTENT_LENGTH 를 넘은 경우
+@app.errorhandler(413)
+def request_too_large(e):
+    limit_mb = app_config.MAX_REQUEST_BYTES // (1024 * 1024)
+    if request.path.startswith("/api/"):
+        return jsonify({"error": f"업로드 용량이 너무 큽니다 (최대 {limit_mb}MB)."}), 413
+    flash(f"업로드 용량이 너무 큽니다 (최대 {limit_mb}MB).")
+    return redirect(request.referrer or url_for("view_list"))
+
+
+# 요청당 DB 호출 수를 응답 헤더로 (debug 모드 또는 DB_DEBUG_HEADERS=1)
+@app.after_request
+def add_db_debug_headers(response):
+    if app.debug or app_config.DB_DEBUG_HEADERS:
+        stats = request_db_stats()
+        if stats is not None:
+            response.headers["X-DB-Reads"] = str(stats["reads"])
+            response.headers["X-DB-Writes"] = str(stats["writes"])
+            response.headers["X-DB-Memo-Hits"] = str(stats["memo_hits"])
+    return response
+
+
+# 요청/DB 시간 계측 (METRICS=1 일 때): 라우트별 히스토그램 + Server-Timing 헤더
+@app.before_request
+def start_request_metrics():
+    if METRICS.enabled:
+        db_metrics.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    if METRICS.enabled:
+        db_metrics.finish_request(METRICS, request, response)
+    return response
+
+
+def _stats_gauges():
+    # 각 캐시/풀의 stats() 를 market_<이름>_<항목> 게이지로
+    sources = {"fragment_cache": FRAGMENTS.stats(), "images": IMAGES.stats()}
+    if DB.connected:  # 계측 때문에 DB 연결을 새로 만들지는 않는다
+        sources.update({
+            "item_catalog": DB.catalog.stats(),
+            "review_catalog": DB.review_catalog.stats(),
+            "chat_hub": DB.hub.stats(),
+            "presence": DB.presence.stats(),
+            "typing": DB.typing.stats(),
+            "http_pool": DB.http_stats() or {},
+        })
+    return {
+        f"market_{source}_{key}": {(): value}
+        for source, stats in sources.items()
+        for key, value in stats.items()
+    }
+
+
+@app.route("/debug/metrics")
+def debug_metrics():
+    if not METRICS.enabled:
+        abort(404)
+    if app_config.METRICS_TOKEN and \
+            request.headers.get("Authorization") != f"Bearer {app_config.METRICS_TOKEN}":
+        abort(403)
+    return Response(
+        METRICS.render(_stats_gauges()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# 로드밸런서/배포용 상태 확인
+#   /healthz : 프로세스가 요청을 받을 수 있는지 (DB 는 보지 않음)
+#   /readyz  : DB 까지 닿는지. 실패하면 503 이라 트래픽에서 빠진다
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    if not DB.ping():
+        return jsonify({"status": "unavailable", "pid": os.getpid()}), 503
+    return jsonify({"status": "ready", "pid": os.getpid()})
+
+
 # 홈 = 리스트
 @app.route("/", strict_slashes=False)
 def home():
@@ -85,52 +269,50 @@ def view_list():
     page = request.args.get("page", 1, type=int)
     q = request.args.get("q", "").strip()
     sort = request.args.get("sort", "")
+    after = request.args.get("after", "").strip()  # 커서: 이 상품 다음부터
 
-    per_page = 15
+    key = ("list", q, sort, page, after, DB.items_version())
+    return render_cached("list.html", key, lambda: _list_context(page, q, sort, after), public=True)
 
-    data = DB.get_items() or {}  
-    items = list(data.items())
 
-    filtered = []
-    for name, info in items:
-        if not isinstance(info, dict):
-            print("⚠ 잘못된 item 데이터:", name, type(info), info)
-            continue
-            
-        seller = info.get("seller", "")
-        if q:
-            if (q.lower() not in name.lower()) and (q.lower() not in seller.lower()):
-                continue
-        filtered.append((name, info))
+def _list_context(page, q, sort, after):
+    per_page = 15
 
-    if sort == "price_asc":
-        filtered.sort(key=lambda kv: safe_int(kv[1].get("price")))
-    elif sort == "price_desc":
-        filtered.sort(
-            key=lambda kv: safe_int(kv[1].get("price")),
-            reverse=True
-        )
-    else:
-        filtered.sort(
-            key=lambda kv: float(kv[1].get("created_at", 0)),
-            reverse=True
-        )
+    # 정렬 인덱스 이름 (최신순이 기본)
+    sort_key = sort if sort in ("price_asc", "price_desc") else "latest"
+    next_after = None
 
-    item_counts = len(filtered)
+    if q:
+        # 검색 색인에서 찾기 (정렬을 고르지 않았으면 일치 정도 순)
+        filtered = DB.search_items(q, sort or None)
 
-    page_count = (item_counts + per_page - 1) // per_page if item_counts > 0 else 1
+        item_counts = len(filtered)
+        page_count = (item_counts + per_page - 1) // per_page if item_counts > 0 else 1
 
-    if page < 1:
-        page = 1
-    if page > page_count:
-        page = page_count
+        if page < 1:
+            page = 1
+        if page > page_count:
+            page = page_count
 
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    page_items = filtered[start_idx:end_idx]
+        start_idx = (page - 1) * per_page
+        end_idx = start_idx + per_page
+        page_items = filtered[start_idx:end_idx]
+    else:
+        # 검색어가 없으면 정렬 인덱스에서 한 페이지만 잘라온다
+        if page < 1:
+            page = 1
+        page_items, next_after, item_counts = DB.get_items_page(
+            sort_key, offset=(page - 1) * per_page, limit=per_page, after=after or None
+        )
+        page_count = (item_counts + per_page - 1) // per_page if item_counts > 0 else 1
 
-    return render_template(
-        "list.html",
+        if not after and page > page_count:
+            page = page_count
+            page_items, next_after, _ = DB.get_items_page(
+                sort_key, offset=(page - 1) * per_page, limit=per_page
+            )
+
+    return dict(
         datas=page_items,
         limit=per_page,
         page=page,
@@ -138,6 +320,8 @@ def view_list():
         total=item_counts,
         q=q,
         sort=sort,
+        after=after,
+        next_after=next_after,
     )
 
 
@@ -202,9 +386,13 @@ def register_user():
 
     pw_hash = hashlib.sha256(pw.encode("utf-8")).hexdigest()
 
-    if DB.insert_user(form, pw_hash):
+    result = DB.insert_user(form, pw_hash)
+    if result:
         flash("회원가입이 완료되었습니다. 로그인 해주세요.")
         return redirect(url_for("login"))
+    elif result is None:
+        flash("지금은 아이디를 확인할 수 없습니다. 잠시 후 다시 시도해주세요.")
+        return redirect(url_for("signup"))
     else:
         flash("이미 존재하는 아이디입니다.")
         return redirect(url_for("signup"))
@@ -217,30 +405,12 @@ def reg_item_submit_post():
         flash("로그인 후 이용해주세요.")
         return redirect(url_for("login"))
 
-    # 1) 여러 장 파일 처리
+    # 1) 폼 데이터 확인 (파일은 폼이 올바를 때만 저장한다)
     files = request.files.getlist("file")
     if not files or files[0].filename == "":
         flash("대표 사진을 업로드해주세요.")
         return redirect(url_for("register_items"))
 
-    image_dir = os.path.join(app.static_folder, "images")
-    os.makedirs(image_dir, exist_ok=True)
-
-    filenames = []
-    for f in files[:10]:  # 최대 10장
-        if f and f.filename:
-            original_name = secure_filename(f.filename)
-            _, ext = os.path.splitext(original_name)
-            unique_name = f"{uuid.uuid4().hex}{ext}"
-            save_path = os.path.join(image_dir, unique_name)
-            f.save(save_path)
-            filenames.append(unique_name)
-
-    if not filenames:
-        flash("이미지 저장에 실패했습니다.")
-        return redirect(url_for("register_items"))
-
-    # 2) 폼 데이터 처리
     form = request.form
 
     item_name = (form.get("item_name") or "").strip()
@@ -261,6 +431,22 @@ def reg_item_submit_post():
     description = (form.get("description") or "").strip()
     seller_id = session["id"]  # 폼 값 대신 세션 사용
 
+    # 2) 여러 장 파일 처리
+    image_dir = os.path.join(app.static_folder, "images")
+
+    # 조금씩 임시 파일에 쓰면서 크기/형식 확인 후 최종 이름으로 옮긴다
+    try:
+        filenames = save_images(
+            files, image_dir, app_config.MAX_IMAGE_BYTES, app_config.MAX_ITEM_IMAGES
+        )
+    except UploadError as e:
+        flash(str(e))
+        return redirect(url_for("register_items"))
+
+    if not filenames:
+        flash("이미지 저장에 실패했습니다.")
+        return redirect(url_for("register_items"))
+
     data = {
         "seller": seller_id,
         "addr": address,
@@ -274,9 +460,12 @@ def reg_item_submit_post():
         "phone": "",
     }
 
-    # Firebase에 저장
+    # Firebase에 저장 (실패하면 참조 없는 파일은 gc-images 가 나중에 치운다)
     DB.insert_item(item_name, data, filenames)
 
+    # 목록/상세용 작은 사본은 응답을 기다리게 하지 않고 뒤에서 만든다
+    IMAGES.submit(filenames)
+
     # 등록 결과 페이지 대신, 바로 상세 페이지로 이동
     return redirect(url_for("view_item_detail", name=item_name))
 
@@ -307,8 +496,8 @@ def complete_item(name):
     if item.get("seller") != session["id"]:
         return jsonify({"msg": "본인이 등록한 상품만 변경할 수 있습니다."}), 403
 
-    # 상태를 'sold' 로 표시
-    DB.db.child("item").child(name).update({"status": "sold"})
+    # 상태를 'sold' 로 표시 (판매자별 인덱스/목록 캐시도 같이 갱신)
+    DB.mark_item_sold(name, item.get("seller"))
 
     return jsonify({"msg": "거래완료로 표시되었습니다."})
 
@@ -320,20 +509,26 @@ def wishlist():
         return redirect(url_for("login"))
 
     heart_data = DB.db.child("heart").child(user_id).get().val()
-    if not heart_data:
-        items = []
-    else:
-        liked_items = []
+    liked_items = []
+    for name, val in (heart_data or {}).items():
+        if isinstance(val, dict):
+            flag = val.get("interested")
+        else:
+            flag = val
 
-        for name, val in heart_data.items():
-            if isinstance(val, dict):
-                flag = val.get("interested")
-            else:
-                flag = val
+        if flag == "Y":
+            liked_items.append(name)
 
-            if flag == "Y":
-                liked_items.append(name)
-        
+    # 찜한 상품 목록 + 상품 데이터 버전이 같으면 같은 HTML
+    page = request.args.get("page", 1, type=int)
+    key = ("wishlist", tuple(sorted(liked_items)), page, DB.items_version())
+    return render_cached("wishlist.html", key, lambda: _wishlist_context(liked_items, page))
+
+
+def _wishlist_context(liked_items, page):
+    if not liked_items:
+        items = []
+    else:
         all_items = DB.get_items() or {}
         
         items = []
@@ -344,7 +539,6 @@ def wishlist():
                 items.append((k, info))
 
     # --- 페이지네이션 ---
-    page = request.args.get("page", 1, type=int)
     per_page = 15
     total = len(items)
     page_count = (total + per_page - 1) // per_page
@@ -353,8 +547,7 @@ def wishlist():
     end = start + per_page
     page_items = items[start:end]
 
-    return render_template(
-        "wishlist.html",
+    return dict(
         datas=page_items,
         page=page,
         page_count=page_count,
@@ -387,8 +580,12 @@ def DynamicUrl(varible_name):
 
 
 @app.route("/view_detail/<name>/")
-def view_item_detail(name):
-    data = DB.get_item_byname(str(name))
+async def view_item_detail(name):
+    # 상품/거래 상태는 서로 관계없으니 동시에 읽어 둔다
+    data, trans_data = await ADB.gather(
+        (ADB.get_item_byname, str(name)),
+        (ADB.get_transaction_status, name),
+    )
     if not data:
         # 안전하게 404 처리 (선택)
         from flask import abort
@@ -396,16 +593,19 @@ def view_item_detail(name):
 
     seller_id = data.get('seller')
     if seller_id:
-        review_stats = DB.get_seller_review_stats(seller_id)
+        review_stats, seller_feedback = await ADB.gather(
+            (ADB.get_seller_review_stats, seller_id),
+            (ADB.get_seller_feedback, seller_id),
+        )
     else:
         review_stats = {"average_rating": 0.0, "total_reviews": 0}
+        seller_feedback = DB.get_seller_feedback(seller_id)
 
     user_id = session.get("id")
     can_review = False
     transaction_status = None
-    seller_feedback = DB.get_seller_feedback(seller_id)
 
-    trans_data = DB.get_transaction_status(name) or {}
+    trans_data = trans_data or {}
     transaction_status = trans_data.get("status")
     buyer_id = trans_data.get("buyer")
 
@@ -438,14 +638,100 @@ def get_chat_history(item_name):
         return jsonify({"error": "Item not found"}), 404
 
     seller_id = item_data.get("seller")
-    buyer_id = session['id']
+    current_user_id = session['id']
 
-    user_ids = sorted([buyer_id, seller_id])
+    # 판매자가 보는 경우 상대 구매자는 ?with= 로 받는다
+    other_user_id = request.args.get("with") or seller_id
+    user_ids = sorted([current_user_id, other_user_id])
     conversation_id = f"{user_ids[0]}_{user_ids[1]}_{item_name}"
 
-    messages = DB.get_messages(conversation_id)
+    # 페이지 단위로: limit 개씩, before(더 이전) / since(새 메시지) 는 메시지 key
+    limit = request.args.get("limit", app_config.CHAT_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), app_config.CHAT_PAGE_MAX)
+    before = request.args.get("before") or None
+    since = request.args.get("since") or None
+
+    messages = DB.get_messages(conversation_id, limit=limit, before=before, since=since)
+    if not before and not since:
+        # 대화를 처음 열 때 읽은 것으로 표시
+        DB.mark_conversation_read(current_user_id, conversation_id)
+    rows = [dict(msg, id=key) for key, msg in messages.items() if isinstance(msg, dict)]
+
+    # 메시지가 없어도 newest 는 비우지 않는다: 브라우저가 이 값으로 stream 에 붙어서
+    # history 를 읽은 뒤 ~ 구독 전에 온 메시지를 DB 에서 채운다
+    return jsonify({
+        "messages": rows,
+        "oldest": rows[0]["id"] if rows else before,
+        "newest": rows[-1]["id"] if rows else (since or DB.chat_cursor()),
+        # since 는 새 메시지만 보는 용도라 이전 페이지 여부는 따지지 않음
+        "has_more": (not since) and len(messages) >= limit,
+    })
+
+# 새 메시지/입력 중 이벤트를 Server-Sent Events 로 밀어준다
+# (대화 전체가 아니라 새로 생긴 이벤트 하나씩만 전송)
+@app.route("/api/chat/stream/<item_name>")
+def stream_chat(item_name):
+    if 'id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    item_data = DB.get_item_byname(item_name)
+    if not item_data:
+        return jsonify({"error": "Item not found"}), 404
 
-    return jsonify(messages)
+    current_user_id = session['id']
+    other_user_id = request.args.get("with") or item_data.get("seller")
+    user_ids = sorted([current_user_id, other_user_id])
+    conversation_id = f"{user_ids[0]}_{user_ids[1]}_{item_name}"
+
+    # 재접속이면 브라우저가 마지막으로 받은 메시지 id 를 Last-Event-ID 로 보낸다
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+
+    # 놓친 메시지가 없도록 구독을 먼저 걸고 나서 DB 에서 빠진 부분을 채운다
+    sub = DB.hub.subscribe(conversation_id)
+
+    def sse(event, data, event_id=None):
+        lines = f"id: {event_id}\n" if event_id else ""
+        return lines + f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            sent = set()
+            if since:
+                for key, msg in DB.get_messages(conversation_id, since=since).items():
+                    sent.add(key)
+                    yield sse("message", dict(msg, id=key), key)
+            # 접속 시점에 이미 입력 중인 상대가 있으면 바로 알려준다
+            for user_id in DB.get_typing_status(conversation_id):
+                if user_id != current_user_id:
+                    yield sse("typing", {"user": user_id, "is_typing": True})
+            # 끝남 신호를 놓친 "입력 중" 이 TYPING_TTL 쯤 지나면 꺼지도록, 이벤트가 계속
+            # 오더라도 매번 만료를 확인하고 TTL 의 절반보다 오래 기다리지 않는다
+            wait = min(app_config.CHAT_STREAM_PING, app_config.TYPING_TTL / 2)
+            last_ping = time.monotonic()
+            while True:
+                item = sub.get(timeout=wait)
+                DB.expire_typing()
+                if item is False:
+                    break  # 너무 밀려서 끊김 → 브라우저가 다시 접속
+                if item is None:
+                    if time.monotonic() - last_ping >= app_config.CHAT_STREAM_PING:
+                        last_ping = time.monotonic()
+                        yield ": ping\n\n"
+                    continue
+                event, data, event_id = item
+                if event == "message" and event_id in sent:
+                    continue
+                # typing 이벤트는 id 를 붙이지 않아야 Last-Event-ID 가 메시지 key 로 유지된다
+                yield sse(event, data, event_id if event == "message" else None)
+        finally:
+            sub.close()
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Sends a new message
 @app.route("/api/chat/send/<item_name>", methods=['POST'])
@@ -459,6 +745,7 @@ def send_chat_message(item_name):
     if not text:
         return jsonify({"error": "Empty message"}), 400
 
+    DB.prefetch((DB.get_item_byname, item_name), (DB.get_transaction_status, item_name))
     item_data = DB.get_item_byname(item_name)
     if not item_data:
         return jsonify({"error": "Item not found"}), 404
@@ -491,11 +778,10 @@ def send_chat_message(item_name):
 
     conversation_id = f"{user_ids[0]}_{user_ids[1]}_{item_name}"
     
-    success = DB.add_message(conversation_id, current_user_id, text)
+    # 메시지 + 양쪽 채팅 목록 연결을 한 번에 저장
+    success = DB.send_message(conversation_id, current_user_id, other_for_link, item_name, text)
     
     if success:
-        DB.link_user_to_conversation(current_user_id, conversation_id, item_name, other_for_link)
-        DB.link_user_to_conversation(other_for_link, conversation_id, item_name, current_user_id)
         return jsonify({"status": "success"})
     
     return jsonify({"error": "Failed"}), 500
@@ -533,45 +819,30 @@ def send_chat_with_image(item_name):
     # ==== Save image ====
     image_url = ""
     if image_file and image_file.filename:
-        from werkzeug.utils import secure_filename
-        import uuid, os
-
-        filename = secure_filename(image_file.filename)
-        _, ext = os.path.splitext(filename)
-        unique_name = f"{uuid.uuid4().hex}{ext}"
-
         save_dir = os.path.join(app.static_folder, "chat_images")
-        os.makedirs(save_dir, exist_ok=True)
-
-        save_path = os.path.join(save_dir, unique_name)
-        image_file.save(save_path)
+        try:
+            unique_name = save_image(image_file, save_dir, app_config.MAX_IMAGE_BYTES)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), 400
 
         image_url = url_for("static", filename=f"chat_images/{unique_name}", _external=False)
 
-    # ===== Save message to Firebase =====
-    success = DB.add_message(
+    # ===== Save message + chat links to Firebase (한 번의 multi-path update) =====
+    success = DB.send_message(
         conversation_id=conversation_id,
         sender_id=current_user_id,
+        other_user_id=other_for_link,
+        item_name=item_name,
         text=text,
         image_url=image_url or None
     )
 
     if not success:
+        if image_url:
+            # 메시지가 저장되지 않았으니 참조 없는 이미지는 정리 대상
+            DB.release_images([f"chat_images/{unique_name}"])
         return jsonify({"error": "Failed to send message"}), 500
 
-    DB.link_user_to_conversation(
-        user_id=current_user_id,
-        conversation_id=conversation_id,
-        item_name=item_name,
-        other_user_id=other_for_link
-    )
-    DB.link_user_to_conversation(
-        user_id=other_for_link,
-        conversation_id=conversation_id,
-        item_name=item_name,
-        other_user_id=current_user_id
-    )
-
     return jsonify({"status": "success", "message": "Message with image sent"})
 
 @app.route("/my_messages")
@@ -582,8 +853,8 @@ def my_messages():
     
     my_id = session['id']
     
-    # Get list of chats from DB
-    conversations_dict = DB.get_user_conversations(my_id)
+    # 내 채팅 목록 한 곳만 최근 대화 순으로 읽는다
+    conversations_dict = DB.get_user_conversations(my_id, limit=app_config.INBOX_LIMIT)
     
     # Convert to a list for the HTML loop
     conversations_list = list(conversations_dict.values()) if conversations_dict else []
@@ -591,6 +862,25 @@ def my_messages():
     return render_template("my_messages.html", conversations=conversations_list)
 
 
+# 채팅창을 닫을 때 (열려 있는 동안 받은 메시지까지) 읽음 처리
+@app.route("/api/chat/read/<item_name>", methods=['POST'])
+def mark_chat_read(item_name):
+    if 'id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    seller_id = DB.get_item_seller(item_name)
+    if not seller_id:
+        return jsonify({"error": "Item not found"}), 404
+
+    current_user_id = session['id']
+    other_user_id = (request.json or {}).get("other_user_id") or seller_id
+    user_ids = sorted([current_user_id, other_user_id])
+    conversation_id = f"{user_ids[0]}_{user_ids[1]}_{item_name}"
+
+    DB.mark_conversation_read(current_user_id, conversation_id)
+    return jsonify({"status": "success"})
+
+
 @app.route("/api/chat/delete/<conversation_id>", methods=['POST'])
 def delete_chat(conversation_id):
     if 'id' not in session:
@@ -607,22 +897,22 @@ def delete_chat(conversation_id):
         return jsonify({"error": "Failed to delete"}), 500
 
 @app.route("/mypage")
-def mypage():
+async def mypage():
     if "id" not in session:
         flash("로그인 후 이용해주세요.")
         return redirect(url_for("login"))
 
     user_id = session["id"]
 
-    stats = DB.get_seller_review_stats(user_id)
+    # 리뷰 통계 / 내 상품 / 거래 내역은 서로 관계없으니 동시에 읽는다
+    stats, all_my_uploads, history = await ADB.gather(
+        (ADB.get_seller_review_stats, user_id),
+        (ADB.get_items_by_seller, user_id),
+        (ADB.get_transactions_by_user, user_id),
+    )
     avg_rating = stats["average_rating"]
     review_count = stats["total_reviews"]
 
-
-    all_my_uploads = DB.get_items_by_seller(user_id)
-
-    history = DB.get_transactions_by_user(user_id)
-
     sold_items = {}
     bought_items = {}
     my_active_items = {}
@@ -665,12 +955,11 @@ def toggle_typing_status(item_name):
     is_typing = data.get("is_typing", False)  
     other_user_id = data.get("other_user_id") 
 
-    # 상품 정보 (Conversation ID 생성에 필요)
-    item_data = DB.get_item_byname(item_name)
-    if not item_data:
+    # 판매자 id (Conversation ID 생성에 필요)
+    item_owner_id = DB.get_item_seller(item_name)
+    if not item_owner_id:
         return jsonify({"error": "Item not found"}), 404
 
-    item_owner_id = item_data.get("seller")
     current_user_id = session['id']
 
     # 대화 상대 결정 
@@ -704,14 +993,20 @@ def update_user_activity():
 
     if not user_id:
         return jsonify({"status": "ignored", "reason": "missing user_id"}), 400
-    print("🔥 Presence update from:", user_id)
-    print(f"{dt.now(timezone.utc).timestamp()*1000}")
     timestamp = int(dt.now(timezone.utc).timestamp() * 1000)
-    # Update Firebase presence
+    # 메모리 presence 테이블만 갱신 (user_status 에는 주기적으로 모아서 저장됨)
     success = DB.set_user_activity(user_id, timestamp)
 
     return jsonify({"status": "updated" if success else "failed", "user_id": user_id, "timestamp": timestamp})
 
+# 여러 사용자의 접속 여부를 한 번에 조회: /api/user/online?ids=a,b,c
+@app.route("/api/user/online")
+def get_online_users():
+    ids = [u.strip() for u in request.args.get("ids", "").split(",") if u.strip()]
+    if not ids:
+        return jsonify({})
+    return jsonify(DB.get_online_users(ids[:100]))
+
 @app.route("/reg_review_init/<name>/")
 def reg_review_init(name):
     user_id = session.get("id")
@@ -735,12 +1030,13 @@ def reg_review():
     files = request.files.getlist("images[]")
 
     # 이미지 저장
-    img_names = []
-    for f in files:
-        if f and f.filename:
-            filename = secure_filename(f.filename)
-            f.save(os.path.join("static/images", filename))
-            img_names.append(filename)
+    try:
+        img_names = save_images(
+            files, UPLOAD_FOLDER, app_config.MAX_IMAGE_BYTES, app_config.MAX_REVIEW_IMAGES
+        )
+    except UploadError as e:
+        flash(str(e))
+        return redirect(url_for("reg_review_init", name=data.get("name")))
 
     review_info = {
         "user": session["id"], 
@@ -749,7 +1045,8 @@ def reg_review():
         "rate": data.get("rating", "0"),
         "pros": data.get("pros", ""),
         "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-        "img_path": img_names[0] if img_names else ""
+        "img_path": img_names[0] if img_names else "",
+        "img_paths": img_names,
     }
 
     item_name = data.get("name")  
@@ -758,7 +1055,8 @@ def reg_review():
     seller_id = item_info.get("seller") if item_info else None
     review_info["seller"] = seller_id
 
-    DB.db.child("review").child(item_name).set(review_info)
+    DB.insert_review(item_name, review_info)
+    IMAGES.submit(img_names)
 
     return redirect(url_for("view_review"))
 
@@ -781,30 +1079,21 @@ def view_review():
     q = request.args.get("q", "").strip()
     sort = request.args.get("sort", "")
 
-    per_page = 15  
+    key = ("review", q, sort, page, DB.reviews_version())
+    return render_cached("review.html", key, lambda: _review_context(page, q, sort), public=True)
 
-    # DB에서 전체 리뷰 가져오기: { item_name: review_info, ... }
-    raw = DB.get_reviews() or {}
-    items = list(raw.items())   # [(item_name, review_dict), ...]
 
-    # --- 검색 필터링 ---
-    filtered = []
-    for item_name, rv in items:
-        rv = rv or {}
-        user = rv.get("user", "")
-        title = rv.get("title", "")
-
-        if q:
-            q_lower = q.lower()
-            # 상품명(item_name), 리뷰 작성자(user), 리뷰 제목(title)에서 검색
-            if (
-                q_lower not in item_name.lower()
-                and q_lower not in user.lower()
-                and q_lower not in title.lower()
-            ):
-                continue
+def _review_context(page, q, sort):
+    per_page = 15  
 
-        filtered.append((item_name, rv))
+    # --- 검색 필터링 ---
+    if q:
+        # 상품명(item_name), 리뷰 작성자(user), 리뷰 제목(title) 검색 색인 사용
+        filtered = DB.search_reviews(q)
+    else:
+        # DB에서 전체 리뷰 가져오기: { item_name: review_info, ... }
+        raw = DB.get_reviews() or {}
+        filtered = list(raw.items())   # [(item_name, review_dict), ...]
 
     # --- 정렬 ---
     from datetime import datetime
@@ -825,6 +1114,9 @@ def view_review():
     elif sort == "star_desc":
         # 별점 높은 순
         filtered.sort(key=lambda kv: safe_int(kv[1].get("rate")), reverse=True)
+    elif q:
+        # 검색 중이고 정렬을 고르지 않았으면 일치 정도 순 그대로
+        pass
     else:
         # 최신순: date 기준 내림차순
         filtered.sort(
@@ -866,8 +1158,7 @@ def view_review():
             )
         )
 
-    return render_template(
-        "review.html",
+    return dict(
         datas=converted,
         page=page,
         page_count=page_count,
@@ -880,6 +1171,8 @@ def view_review():
 
 @app.route("/api/item/status/<item_name>")
 def get_item_status(item_name):
+    DB.prefetch((DB.get_item_byname, item_name), (DB.get_transaction_status, item_name))
+
     # 1. Get Item Info (to find the seller)
     item_data = DB.get_item_byname(item_name)
     if not item_data:
@@ -946,6 +1239,117 @@ def reg_review_able():
         items=items_for_review
     )
 
+# 예전 push-id 형식 회원 레코드를 user/{id} 키로 옮기는 명령
+#   flask --app app migrate-users
+@app.cli.command("migrate-users")
+def migrate_users_command():
+    moved = DB.migrate_user_keys()
+    print(f"migrated {moved} user records")
+
+
+# 기존 상품 데이터로 seller_items/{seller} 인덱스를 다시 만드는 명령
+# (돌리기 전까지는 판매자 상품 조회가 item 캐시와 인덱스를 합쳐서 보여준다)
+#   flask --app app rebuild-seller-items
+@app.cli.command("rebuild-seller-items")
+def rebuild_seller_items_command():
+    sellers = DB.rebuild_seller_items()
+    print(f"rebuilt seller_items for {sellers} sellers")
+
+
+# seller_stats(판매자 별점 합계/개수)를 리뷰 전체로 다시 계산해서 검사하는 명령
+# (지금 있는 상품의 리뷰만, 상품의 판매자 기준으로 센다)
+#   flask --app app check-seller-stats [--fix]
+@app.cli.command("check-seller-stats")
+@click.option("--fix", is_flag=True, help="불일치가 있으면 다시 계산한 값으로 덮어쓰기")
+def check_seller_stats_command(fix):
+    mismatches = DB.check_seller_stats(fix=fix)
+    for seller_id, diff in mismatches.items():
+        print(f"{seller_id}: stored={diff['stored']} expected={diff['expected']}")
+    print(f"{len(mismatches)} mismatched sellers" + (" (fixed)" if fix and mismatches else ""))
+
+
+# 기존 거래 데이터로 user_transactions/{user} 인덱스를 다시 만드는 명령
+#   flask --app app rebuild-user-transactions
+@app.cli.command("rebuild-user-transactions")
+def rebuild_user_transactions_command():
+    users = DB.rebuild_user_transactions()
+    print(f"rebuilt user_transactions for {users} users")
+
+
+# 이미 올라와 있는 이미지들의 thumb/card/full 사본을 만드는 명령
+#   flask --app app generate-image-variants
+@app.cli.command("generate-image-variants")
+def generate_image_variants_command():
+    if not IMAGES.enabled:
+        print("Pillow 가 설치되어 있지 않아 이미지 사본을 만들 수 없습니다.")
+        return
+    names = IMAGES.missing()
+    results = [future.result() for future in IMAGES.submit(names)]
+    print(f"generated image variants for {sum(results)}/{len(names)} images")
+
+
+# css/js 의 미리 압축한 .gz (brotli 가 있으면 .br 도) 파일을 만드는 명령 (배포 때 실행)
+#   flask --app app compress-assets
+@app.cli.command("compress-assets")
+def compress_assets_command():
+    written = ASSETS.compress()
+    print(f"wrote {len(written)} precompressed files")
+
+
+# 어디서도 참조하지 않는 (내용 해시 이름) 이미지 파일을 지우는 명령
+#   flask --app app gc-images
+@app.cli.command("gc-images")
+def gc_images_command():
+    paths = [
+        f"{folder}/{name}"
+        for folder in ("images", "chat_images")
+        if os.path.isdir(os.path.join(app.static_folder, folder))
+        for name in sorted(os.listdir(os.path.join(app.static_folder, folder)))
+        if CONTENT_NAME.match(name)
+    ]
+    removed = DB.release_images(paths)
+    print(f"removed {len(removed)}/{len(paths)} unreferenced images "
+          f"(files used in the last {app_config.IMAGE_GC_GRACE}s are kept)")
+
+
+# 기존 채팅 목록에 마지막 메시지/상태를 채우고 item_chats 를 만드는 명령
+#   flask --app app rebuild-inbox
+@app.cli.command("rebuild-inbox")
+def rebuild_inbox_command():
+    users = DB.rebuild_inbox()
+    print(f"rebuilt chat inbox for {users} users")
+
+
+# create_app 에 처음 넘긴 설정 (None 이면 아직 안 불림)
+_created_config = None
+
+
+def create_app(config=None, eager_db=False):
+    """설정을 적용한 앱을 돌려준다 (wsgi.py, asgi.py, bench_startup.py).
+
+    새 앱을 만드는 팩토리가 아니다. 라우트, DB, 캐시는 이 모듈을 import 할 때 한 번
+    만들어지는 프로세스당 하나뿐인 app 에 붙어 있고, 여기서는 그 app 에 설정을
+    적용해서 돌려준다. 그래서 두 번째 호출은 처음과 같은 설정일 때만 허용하고,
+    다른 설정이면 RuntimeError 를 낸다 (앞의 호출자가 쓰던 앱의 설정이 몰래
+    바뀌지 않게).
+
+    DB 는 기본적으로 첫 사용 때 연결한다. eager_db 면 여기서 바로 연결해서
+    자격 증명/DB 문제를 서버가 뜰 때 알 수 있다.
+    """
+    global _created_config
+    config = dict(config or {})
+    if _created_config is None:
+        app.config.update(config)
+        _created_config = config
+    elif config != _created_config:
+        raise RuntimeError(
+            "create_app() 은 프로세스당 하나인 app 을 돌려준다: "
+            f"이미 {_created_config} 로 만들었는데 {config} 로 다시 불렸다"
+        )
+    if eager_db:
+        DB.get()
+    return app
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
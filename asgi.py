@@ -0,0 +1,21 @@
+"""ASGI 서버용 진입점 (선택, 필요할 때만).
+
+    pip install "flask[async]" uvicorn     # asgiref 가 필요하다
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+
+Flask 는 WSGI 앱이라 asgiref 의 WsgiToAsgi 로 감싸기만 한 것이다. 요청 하나는
+여전히 스레드 하나에서 블로킹으로 처리되고(열린 채팅 스트림도 스레드 하나를
+잡는다), ASGI 로 띄운다고 동시에 받을 수 있는 연결이 늘지는 않는다. async 뷰 안의
+DB 읽기를 ADB.gather(...) 로 동시에 보내는 것은 WSGI 로 띄워도 똑같다.
+
+운영 서버는 gunicorn.conf.py (gevent 워커) 를 쓴다. uvicorn 같은 ASGI 서버 뒤에
+붙여야 할 때만 이 파일을 쓴다.
+"""
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise ImportError('asgi.py 는 asgiref 가 필요하다: pip install "flask[async]" uvicorn') from e
+
+from app import create_app
+
+application = WsgiToAsgi(create_app())
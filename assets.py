@@ -0,0 +1,133 @@
+"""정적 파일(css/js/이미지) 캐시 설정.
+
+url_for('static', ...) 로 만든 주소에는 파일 내용 해시를 ?v= 로 붙인다. 내용이
+바뀌면 주소가 바뀌므로, ?v= 가 맞는 요청은 브라우저가 1년 동안 다시 묻지 않게
+(immutable) 응답한다. 내용 해시 이름으로 저장된 업로드 이미지도 마찬가지다.
+그 밖의 정적 파일은 no-cache + ETag 로 매번 확인만 하고(변경 없으면 304) 받는다.
+
+미리 압축해 둔 main.js.br / main.js.gz 가 있으면 브라우저가 지원하는 경우 그
+파일을 Content-Encoding 과 함께 보낸다 (flask compress-assets 로 생성).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory
+
+from uploads import CONTENT_NAME
+
+try:
+    import brotli
+except ImportError:  # 없으면 gzip 만 만든다
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# 미리 압축할 확장자 (이미지는 이미 압축된 형식이라 제외)
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticAssets:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._versions = {}  # filename → (mtime, size, hash)
+
+    def version(self, filename):
+        """파일 내용 해시 앞 12자리 (파일이 없으면 None)"""
+        path = os.path.join(self.static_dir, filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._versions.get(filename)
+        if cached and cached[:2] == (st.st_mtime, st.st_size):
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+        version = digest.hexdigest()[:12]
+        with self._lock:
+            self._versions[filename] = (st.st_mtime, st.st_size, version)
+        return version
+
+    def init_app(self, app):
+        # url_for('static', filename=...) 에 ?v=<해시> 를 자동으로 붙인다
+        @app.url_defaults
+        def add_static_version(endpoint, values):
+            if endpoint == "static" and "filename" in values and "v" not in values:
+                version = self.version(values["filename"])
+                if version:
+                    values["v"] = version
+
+        app.view_functions["static"] = self.serve
+
+    def _cache_control(self, filename):
+        version = request.args.get("v")
+        if version and version == self.version(filename):
+            return IMMUTABLE
+        if CONTENT_NAME.match(os.path.basename(filename)):
+            return IMMUTABLE  # 내용 해시 이름은 내용이 절대 바뀌지 않는다
+        return REVALIDATE
+
+    def _precompressed(self, filename):
+        accepted = request.headers.get("Accept-Encoding", "")
+        for encoding, suffix in _ENCODINGS:
+            if encoding not in accepted:
+                continue
+            path = os.path.join(self.static_dir, filename + suffix)
+            original = os.path.join(self.static_dir, filename)
+            # 원본보다 오래된 압축본은 쓰지 않는다
+            if os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(original):
+                return encoding, filename + suffix
+        return None, filename
+
+    def serve(self, filename):
+        encoding, served = None, filename
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE and \
+                os.path.isfile(os.path.join(self.static_dir, filename)):
+            encoding, served = self._precompressed(filename)
+
+        # send_from_directory 가 경로 검사, ETag, If-None-Match → 304 를 처리한다
+        response = send_from_directory(
+            self.static_dir,
+            served,
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=None,
+        )
+        response.headers["Cache-Control"] = self._cache_control(filename)
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+            response.vary.add("Accept-Encoding")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    def compress(self):
+        """압축할 만한 정적 파일의 .gz (brotli 가 있으면 .br 도) 를 만든다"""
+        written = []
+        for root, _, files in os.walk(self.static_dir):
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    data = f.read()
+                outputs = [(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    outputs.append((path + ".br", brotli.compress(data)))
+                for out_path, body in outputs:
+                    if len(body) >= len(data):
+                        continue  # 작아지지 않으면 만들지 않는다
+                    tmp = out_path + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(body)
+                    os.replace(tmp, out_path)
+                    written.append(os.path.relpath(out_path, self.static_dir))
+        return written
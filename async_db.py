@@ -0,0 +1,170 @@
+"""DBhandler 의 비동기(async) 인터페이스.
+
+pyrebase/SQLite 호출은 모두 블로킹이라, 여기서는 DBhandler 메서드를 전용 스레드
+풀에서 돌리고 그 결과를 await 할 수 있게 감싼다. 서로 관계없는 읽기는
+gather() 로 한꺼번에 보내서, 왕복 N 번을 기다리는 대신 가장 느린 한 번만
+기다린다.
+
+    item, trans = await ADB.gather(
+        (ADB.get_item_byname, name),
+        (ADB.get_transaction_status, name),
+    )
+
+읽기 결과는 DBhandler 와 같은 요청 단위 메모(flask.g)에 저장되므로, 이후 같은
+요청에서 동기 메서드로 다시 읽어도 DB 에 또 가지 않는다. 쓰기 메서드는 요청
+컨텍스트를 그대로 넘겨서 실행하므로 메모 비우기/쓰기 횟수도 동기 호출과 같다.
+
+Flask 의 async 뷰는 asgiref 가 있으면 그것으로, 없으면 run_async() 로 요청마다
+이벤트 루프를 하나 띄워 실행한다 (app.async_to_sync 참고).
+
+gevent 워커에서는 한 스레드 안에서 요청 여러 개가 greenlet 으로 번갈아 돌기 때문에
+asyncio.run 을 겹쳐 부를 수 없다 (실행 중인 루프는 스레드마다 하나). 그때는
+run_blocking() 이 이벤트 루프 없이 뷰를 실행하고, ADB 호출은 스레드 풀(gevent 가
+바꿔 끼운 greenlet)의 결과를 기다린다. 이 모드에서 뷰가 await 할 수 있는 것은 ADB
+호출뿐이다.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g
+
+import metrics as db_metrics
+from database import _memo_key, _request_memo
+
+
+def run_async(func):
+    """asgiref 없이 async 뷰를 동기 함수로 (작업 스레드에는 실행 중인 루프가 없다)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return asyncio.run(func(*args, **kwargs))
+    return wrapper
+
+
+def _loop_running():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class _Pending:
+    """이벤트 루프 없이 await 하는 concurrent.futures.Future (run_blocking 이 기다려 줌)"""
+
+    def __init__(self, future):
+        self.future = future
+
+    def __await__(self):
+        return (yield self)
+
+
+class _Started:
+    """첫 await 까지 미리 실행해 둔 코루틴 (루프 없는 gather 가 호출을 한꺼번에 보내려고)"""
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        try:
+            self.pending = coro.send(None)
+        except StopIteration as e:
+            self.done, self.value = True, e.value
+
+    def __await__(self):
+        if self.done:
+            return self.value
+        pending = self.pending
+        while True:
+            try:
+                value = yield pending
+            except BaseException as e:
+                step = functools.partial(self.coro.throw, e)
+            else:
+                step = functools.partial(self.coro.send, value)
+            try:
+                pending = step()
+            except StopIteration as e:
+                return e.value
+
+
+def run_blocking(func):
+    """이벤트 루프 없이 async 뷰를 동기 함수로 (gevent 워커용)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        coro = func(*args, **kwargs)
+        value, error = None, None
+        while True:
+            try:
+                pending = coro.throw(error) if error is not None else coro.send(value)
+            except StopIteration as e:
+                return e.value
+            if not isinstance(pending, _Pending):
+                coro.close()
+                raise TypeError("run_blocking 으로 실행하는 뷰에서는 ADB 호출만 await 할 수 있다")
+            value, error = None, None
+            try:
+                value = pending.future.result()
+            except BaseException as e:
+                error = e
+    return wrapper
+
+
+class AsyncDBhandler:
+    def __init__(self, db, workers=8):
+        self.db = db
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-async")
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # fork 된 자식에는 부모의 작업 스레드가 없다
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db-async")
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.call(attr, *args, **kwargs)
+        # 한 번 만든 래퍼는 다시 만들지 않는다
+        setattr(self, name, method)
+        return method
+
+    async def _run(self, fn):
+        future = self._pool.submit(fn)
+        if _loop_running():
+            return await asyncio.wrap_future(future)
+        return await _Pending(future)
+
+    async def call(self, fn, *args, **kwargs):
+        """DBhandler 메서드 하나를 스레드 풀에서 실행"""
+        memo = _request_memo()
+
+        if memo is None or not getattr(fn, "memoized", False):
+            # 쓰기/메모 없는 읽기: 요청 컨텍스트째로 넘겨 동기 호출과 똑같이 동작
+            ctx = contextvars.copy_context()
+            return await self._run(functools.partial(ctx.run, fn, *args, **kwargs))
+
+        key = _memo_key(fn.__name__, args, kwargs)
+        if key in memo:
+            g._db_stats["memo_hits"] += 1
+            return memo[key]
+        # 작업 스레드에는 요청 컨텍스트가 없으므로 메모 없이 바로 읽고, 저장은 여기서
+        g._db_stats["reads"] += 1
+        value, seconds = await self._run(functools.partial(db_metrics.timed, fn, *args, **kwargs))
+        db_metrics.add_request_db(seconds)
+        memo[key] = value
+        return value
+
+    async def gather(self, *calls):
+        """(메서드, 인자...) 들을 동시에 실행하고 결과를 같은 순서의 리스트로"""
+        coros = [fn(*args) for fn, *args in calls]
+        if _loop_running():
+            return await asyncio.gather(*coros)
+        # 루프 없이 실행 중(run_blocking): 전부 풀에 넣어 두고 나서 차례로 기다린다
+        started = [_Started(coro) for coro in coros]
+        return [await step for step in started]
@@ -0,0 +1,80 @@
+"""시작 시간 측정: app import / create_app() / 첫 요청 / 두 번째 요청 (ms).
+
+    python bench_startup.py                 # 5번 측정해서 중앙값/최솟값
+    python bench_startup.py -n 10 --json    # 한 줄 JSON (기록을 쌓아 두고 비교할 때)
+
+매번 새 파이썬 프로세스로 재므로 import 캐시가 섞이지 않는다. DB_BACKEND 를
+따로 주지 않으면 sqlite :memory: 로 잰다 (네트워크 시간 제외).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 자식 프로세스에서 실행할 코드: 단계별 시간을 JSON 한 줄로 출력
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import app as appmod
+t1 = time.perf_counter()
+application = appmod.create_app()
+t2 = time.perf_counter()
+client = application.test_client()
+first = client.get(PATH)
+t3 = time.perf_counter()
+client.get(PATH)
+t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "second_request_ms": (t4 - t3) * 1000,
+    "status": first.status_code,
+}))
+"""
+
+STEPS = ("import_ms", "create_app_ms", "first_request_ms", "second_request_ms")
+
+
+def run_once(path):
+    env = dict(os.environ)
+    env.setdefault("DB_BACKEND", "sqlite")
+    env.setdefault("SQLITE_PATH", ":memory:")
+    out = subprocess.run(
+        [sys.executable, "-c", f"PATH = {path!r}\n" + PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # 앱이 찍는 로그 다음의 마지막 줄이 결과
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--path", default="/list")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    runs = [run_once(args.path) for _ in range(args.runs)]
+    summary = {
+        step: {
+            "median": round(statistics.median(r[step] for r in runs), 1),
+            "min": round(min(r[step] for r in runs), 1),
+        }
+        for step in STEPS
+    }
+    if args.json:
+        print(json.dumps({"runs": args.runs, "path": args.path, **summary}))
+        return
+
+    print(f"{args.runs} runs, GET {args.path} (status {runs[0]['status']})")
+    for step in STEPS:
+        print(f"  {step:<18} median {summary[step]['median']:>7.1f}  min {summary[step]['min']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""상품(item)/리뷰(review) 목록 메모리 캐시.
+
+/list 같은 목록 페이지는 요청마다 item 트리 전체를 내려받았는데,
+여기서 한 번 읽은 트리를 TTL 동안 재사용하고 상품이 등록/삭제/거래완료될 때
+캐시를 같이 고친다.
+
+정렬 기준별(최신순, 가격 낮은/높은 순) 정렬 인덱스와 검색 역색인도 함께 들고
+있어서 목록 페이지는 매번 전체를 정렬/검색하지 않고 필요한 구간만 잘라서 쓴다.
+"""
+import bisect
+import threading
+import time
+
+from search import SearchIndex
+
+
+def _safe_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _safe_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# 정렬 이름 → 정렬 키. 인덱스는 모두 이 키의 오름차순 리스트로 유지한다.
+# (동점일 때는 상품 이름 순)
+ITEM_SORT_KEYS = {
+    "latest": lambda name, info: (-_safe_float(info.get("created_at", 0)), name),
+    "price_asc": lambda name, info: (_safe_int(info.get("price")), name),
+    "price_desc": lambda name, info: (-_safe_int(info.get("price")), name),
+}
+DEFAULT_SORT = "latest"
+
+# 검색 대상 필드와 가중치 ("$key" 는 상품 이름/리뷰 대상 상품 이름)
+ITEM_SEARCH_FIELDS = {"$key": 3.0, "seller": 2.0, "description": 1.0}
+REVIEW_SEARCH_FIELDS = {"$key": 3.0, "title": 2.0, "user": 2.0}
+
+
+class NodeCatalog:
+    def __init__(self, loader, ttl=30, sort_keys=None, search_fields=None):
+        # loader: 노드 트리 전체를 {key: info} 로 돌려주는 함수
+        self._loader = loader
+        self.ttl = ttl
+        self._sort_keys = sort_keys or {}
+        self._search_fields = search_fields
+        self._lock = threading.Lock()
+        self._items = None
+        self._indexes = {}
+        self._search = None
+        self._loaded_at = 0.0
+        # 내용이 바뀔 때마다 올라가는 번호 (HTML 조각 캐시 키에 사용)
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fresh(self):
+        return self._items is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self):
+        # lock 을 잡은 상태에서만 호출
+        if self._fresh():
+            self.hits += 1
+            return
+
+        # 동시에 여러 요청이 miss 나도 DB 는 한 번만 읽도록 lock 안에서 로드
+        self.misses += 1
+        items = self._loader() or {}
+        self._loaded_at = time.monotonic()
+        if items == self._items:
+            # TTL 이 지나서 다시 읽었지만 내용이 같으면 버전/인덱스를 그대로 둔다
+            # (버전이 오르면 HTML 조각 캐시가 전부 버려진다)
+            return
+        self._items = items
+        self.version += 1
+        self._indexes = {
+            sort: sorted(
+                key_fn(name, info)
+                for name, info in self._items.items()
+                if isinstance(info, dict)
+            )
+            for sort, key_fn in self._sort_keys.items()
+        }
+        if self._search_fields:
+            self._search = SearchIndex(self._search_fields)
+            for name, info in self._items.items():
+                if isinstance(info, dict):
+                    self._search.add(name, info)
+
+    def get_items(self):
+        # 반환값은 캐시 자체이므로 호출하는 쪽에서 수정하지 말 것
+        with self._lock:
+            self._ensure_loaded()
+            return self._items
+
+    def get_item(self, name):
+        with self._lock:
+            self._ensure_loaded()
+            return self._items.get(name)
+
+    def invalidate(self):
+        with self._lock:
+            self._items = None
+            self._indexes = {}
+            self._search = None
+            self.invalidations += 1
+            self.version += 1
+
+    # --- 상품 하나 단위 갱신 (정렬 인덱스/검색 색인도 같이 고친다) ---
+    def _unindex(self, name):
+        if self._search is not None:
+            self._search.remove(name)
+        old = self._items.get(name)
+        if not isinstance(old, dict):
+            return
+        for sort, key_fn in self._sort_keys.items():
+            index = self._indexes[sort]
+            i = bisect.bisect_left(index, key_fn(name, old))
+            if i < len(index) and index[i][-1] == name:
+                del index[i]
+
+    def put(self, name, info):
+        with self._lock:
+            if self._items is None:
+                return  # 아직 안 읽었으면 다음 로드 때 반영됨
+            self._unindex(name)
+            # 읽는 쪽이 들고 있는 dict 가 바뀌지 않도록 새 dict 로 교체
+            items = dict(self._items)
+            items[name] = info
+            self._items = items
+            self.version += 1
+            if isinstance(info, dict):
+                for sort, key_fn in self._sort_keys.items():
+                    bisect.insort(self._indexes[sort], key_fn(name, info))
+                if self._search is not None:
+                    self._search.add(name, info)
+
+    def patch(self, name, fields):
+        # 이미 캐시에 있는 상품의 일부 필드만 고친다 (없으면 다음 로드 때 반영)
+        with self._lock:
+            info = self._items.get(name) if self._items is not None else None
+        if isinstance(info, dict):
+            self.put(name, dict(info, **fields))
+
+    def discard(self, name):
+        with self._lock:
+            if self._items is None or name not in self._items:
+                return
+            self._unindex(name)
+            items = dict(self._items)
+            del items[name]
+            self._items = items
+            self.version += 1
+
+    def current_version(self):
+        """지금 캐시 내용의 버전 (TTL 이 지났으면 다시 읽고 나서)"""
+        with self._lock:
+            self._ensure_loaded()
+            return self.version
+
+    # --- 목록 조회 ---
+    def search(self, q, sort=None):
+        """검색어에 맞는 (key, info) 목록
+
+        sort 가 정렬 인덱스 이름이면 그 순서로, 아니면 검색 점수(일치 정도)
+        높은 순으로 돌려준다. 점수가 같으면 기본 정렬 순서를 따른다.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._search is None:
+                return []
+            scores = dict(self._search.search(q))
+
+            if sort in self._sort_keys:
+                key_fn = self._sort_keys[sort]
+                order = lambda k: key_fn(k, self._items[k])
+            elif DEFAULT_SORT in self._sort_keys:
+                key_fn = self._sort_keys[DEFAULT_SORT]
+                order = lambda k: (-scores[k], key_fn(k, self._items[k]))
+            else:
+                order = lambda k: (-scores[k], k)
+            return [(k, self._items[k]) for k in sorted(scores, key=order)]
+
+    def page(self, sort=DEFAULT_SORT, offset=0, limit=15, after=None):
+        """정렬 순서에서 한 페이지만 잘라서 반환: (rows, next_after, total)
+
+        after 에 상품 이름을 주면 그 상품 바로 다음부터 (커서 방식),
+        아니면 offset 부터 limit 개를 가져온다. next_after 는 다음 페이지가
+        있을 때 마지막 상품 이름, 없으면 None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if sort not in self._sort_keys:
+                sort = DEFAULT_SORT
+            index = self._indexes[sort]
+
+            start = max(offset, 0)
+            if after:
+                info = self._items.get(after)
+                if isinstance(info, dict):
+                    start = bisect.bisect_right(index, self._sort_keys[sort](after, info))
+                else:
+                    start = 0  # 커서 상품이 삭제됐으면 처음부터
+
+            entries = index[start:start + limit]
+            rows = [(entry[-1], self._items[entry[-1]]) for entry in entries]
+            has_more = start + limit < len(index)
+            next_after = rows[-1][0] if rows and has_more else None
+            return rows, next_after, len(index)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size": len(self._items) if self._items is not None else 0,
+            }
@@ -0,0 +1,222 @@
+"""채팅 실시간 전달용 pub/sub.
+
+브라우저가 conversations/<id> 전체에 Firebase 리스너를 걸면 메시지가 하나 올
+때마다 대화 전체가 다시 내려간다. 대신 서버가 메시지를 저장할 때 여기로
+발행(publish)하고, /api/chat/stream 에 붙어 있는 구독자에게는 새 메시지/입력 중
+이벤트 하나씩만 보낸다.
+
+구독자마다 크기 제한이 있는 큐를 하나씩 들고 있고, 큐가 꽉 찬(안 읽는) 구독자는
+끊어 버린다. 끊긴 브라우저는 EventSource 가 마지막 메시지 id 로 다시 붙으면서
+빠진 메시지를 DB 에서 채운다.
+
+구독자 목록은 워커 프로세스마다 따로다. config.CHAT_BROKER_URL(redis://...)을
+주면 발행은 Redis pub/sub 의 chat:<대화 id> 채널로 나가고, 워커마다 리스너
+스레드 하나가 chat:* 를 받아서 자기 구독자에게 넣는다. 그래서 같은 대화의 두
+사람이 서로 다른 워커에 붙어 있어도 실시간으로 받는다 (pip install redis).
+없으면 이 프로세스 안에서만 전달한다 (개발용 단일 프로세스).
+
+on(event, fn) 으로 건 함수는 이벤트를 받은 모든 프로세스에서 구독자에게 넣기 전에
+불린다. "입력 중" 상태처럼 워커마다 들고 있어야 하는 상태를 여기서 맞추고, False 를
+돌려주면 구독자에게는 보내지 않는다 (상태가 바뀌지 않은 갱신).
+"""
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+
+class Subscription:
+    def __init__(self, hub, channel, maxsize):
+        self.hub = hub
+        self.channel = channel
+        self.closed = False
+        self._queue = queue.Queue(maxsize)
+
+    def _offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout=None):
+        """다음 이벤트 (event, data, id). timeout 동안 없으면 None, 끊겼으면 False"""
+        if self.closed and self._queue.empty():
+            return False
+        try:
+            event = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return False if event is None else event
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class RedisBroker:
+    """Redis pub/sub 으로 모든 워커에 이벤트를 돌린다.
+
+    워커는 대화마다 구독을 바꾸지 않고 chat:* 패턴 하나만 구독한다 (대화 수만큼
+    SUBSCRIBE 를 주고받지 않게). 받은 이벤트 중 이 워커에 구독자가 없는 대화는
+    ChatHub 에서 바로 버려진다.
+    """
+
+    PREFIX = "chat:"
+
+    def __init__(self, url):
+        import redis  # 선택 의존성: CHAT_BROKER_URL 을 줄 때만 필요
+
+        self._redis = redis.Redis.from_url(url)
+        self._thread = None
+        self._receive = None
+        self._ready = threading.Event()
+
+    def publish(self, channel, event, data, event_id=None):
+        message = json.dumps([event, data, event_id], ensure_ascii=False)
+        self._redis.publish(self.PREFIX + channel, message)
+
+    def start(self, receive):
+        # 리스너는 실제로 쓰는 프로세스(워커)에서 처음 쓸 때 띄운다
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._receive = receive
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._listen, name="chat-broker", daemon=True)
+        self._thread.start()
+        # 구독이 걸리기 전에 발행된 이벤트는 받을 수 없으므로 잠깐 기다린다
+        self._ready.wait(timeout=2)
+
+    def after_fork(self):
+        # fork 된 자식에는 부모의 리스너 스레드가 없다 (redis 연결 풀은 pid 를 보고 새로 연결)
+        self._thread = None
+
+    def _listen(self):
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(self.PREFIX + "*")
+                self._ready.set()
+                for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    event, data, event_id = json.loads(message["data"])
+                    self._receive(channel[len(self.PREFIX):], event, data, event_id)
+            except Exception as e:
+                # 연결이 끊기면 잠깐 쉬고 다시 구독 (그 사이 메시지는 재접속 때 DB 에서 채움)
+                print(f"⚠️ 채팅 브로커 연결 끊김, 다시 연결: {e}")
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+def make_broker(url):
+    """CHAT_BROKER_URL 에 맞는 브로커 (비어 있으면 None = 프로세스 안에서만 전달)"""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"지원하지 않는 CHAT_BROKER_URL: {url}")
+
+
+class ChatHub:
+    def __init__(self, max_queue=100, broker=None):
+        self.max_queue = max_queue
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+        self._seq = itertools.count(1)
+        self._handlers = {}  # event → fn(channel, data), False 면 구독자에게 안 보냄
+
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        if self.broker is not None:
+            self.broker.after_fork()
+
+    def _start_broker(self):
+        if self.broker is not None:
+            self.broker.start(self._receive)
+
+    def on(self, event, fn):
+        """event 를 받을 때마다 (이 프로세스에서) fn(channel, data) 를 먼저 부른다"""
+        self._handlers[event] = fn
+
+    def subscribe(self, channel):
+        self._start_broker()
+        sub = Subscription(self, channel, self.max_queue)
+        with self._lock:
+            self._channels[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._channels.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._channels[sub.channel]
+        if not sub.closed:
+            sub.closed = True
+            sub._offer(None)  # get() 에서 기다리던 쪽을 깨운다
+
+    def publish(self, channel, event, data, event_id=None):
+        """channel 구독자 모두(브로커가 있으면 모든 워커)에게 이벤트 하나를 보낸다.
+
+        이 프로세스에서 받은 구독자 수를 반환 (브로커로 보낸 경우는 0)
+        """
+        with self._lock:
+            self.published += 1
+        if self.broker is not None:
+            self._start_broker()
+            self.broker.publish(channel, event, data, event_id)
+            return 0
+        return self._receive(channel, event, data, event_id)
+
+    def _receive(self, channel, event, data, event_id=None):
+        handler = self._handlers.get(event)
+        if handler is not None and handler(channel, data) is False:
+            return 0
+        return self.publish_local(channel, event, data, event_id)
+
+    def publish_local(self, channel, event, data, event_id=None):
+        """이 프로세스의 channel 구독자에게만 넣는다 (on() 함수는 부르지 않음)"""
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+        if not subs:
+            return 0
+
+        item = (event, data, event_id or str(next(self._seq)))
+        delivered = 0
+        for sub in subs:
+            if sub._offer(item):
+                delivered += 1
+            else:
+                # 안 읽고 쌓이기만 하는 구독자 → 끊고 재접속 때 DB 에서 채우게 한다
+                with self._lock:
+                    self.dropped += 1
+                self.unsubscribe(sub)
+        with self._lock:
+            self.delivered += delivered
+        return delivered
+
+    def stats(self):
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "subscribers": sum(len(s) for s in self._channels.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
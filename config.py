@@ -0,0 +1,88 @@
+import os
+
+# 환경변수로 덮어쓸 수 있는 서버 설정값 모음
+
+# 저장소 선택: "firebase"(기본, 실제 서비스) 또는 "sqlite"(로컬/부하 테스트용)
+DB_BACKEND = os.environ.get("DB_BACKEND", "firebase")
+
+# sqlite 저장소 파일 경로 (":memory:" 도 가능)
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "./market.db")
+
+# /list 등에서 쓰는 상품 목록 메모리 캐시 유지 시간(초). 0 이면 캐시 안 함
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", "30"))
+
+# 한 요청 안의 서로 관계없는 DB 읽기를 동시에 실행할 스레드 수
+DB_PREFETCH_WORKERS = int(os.environ.get("DB_PREFETCH_WORKERS", "8"))
+
+# 응답에 X-DB-* 헤더(요청당 DB 호출 수)를 붙일지 (debug 모드에서는 항상 붙음)
+DB_DEBUG_HEADERS = os.environ.get("DB_DEBUG_HEADERS", "0") == "1"
+
+# /api/chat/history 한 번에 내려주는 메시지 수 (기본값 / 최대값)
+CHAT_PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", "50"))
+CHAT_PAGE_MAX = int(os.environ.get("CHAT_PAGE_MAX", "200"))
+
+# /api/chat/stream 구독자 하나당 쌓아 둘 수 있는 이벤트 수 (넘으면 연결을 끊음)
+CHAT_STREAM_QUEUE = int(os.environ.get("CHAT_STREAM_QUEUE", "100"))
+# 이벤트가 없을 때 연결 유지용 주석(keep-alive)을 보내는 간격(초)
+CHAT_STREAM_PING = float(os.environ.get("CHAT_STREAM_PING", "15"))
+# 채팅 이벤트를 모든 워커에 돌릴 브로커 (예: redis://localhost:6379/0, pip install redis).
+# 비우면 한 프로세스 안에서만 전달 → 워커가 여러 개인 운영 서버에서는 꼭 설정
+CHAT_BROKER_URL = os.environ.get("CHAT_BROKER_URL", "")
+
+# 접속 시각(user_status)을 DB 에 모아서 저장하는 간격(초). 0 이면 바로 저장
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get("PRESENCE_FLUSH_INTERVAL", "10"))
+# 마지막 접속 후 이 시간(초) 안이면 온라인으로 본다 (main.js 의 5분과 같게)
+PRESENCE_ONLINE_WINDOW = float(os.environ.get("PRESENCE_ONLINE_WINDOW", "300"))
+
+# 메모리의 접속 시각을 DB(user_status) 다시 확인 없이 믿는 시간(초).
+# 워커가 여러 개면 다른 워커가 받은 핑은 이 시간 뒤에 보인다
+PRESENCE_CACHE_MAX_AGE = float(os.environ.get("PRESENCE_CACHE_MAX_AGE", "30"))
+
+# "입력 중" 상태를 갱신 없이 유지하는 시간(초)
+TYPING_TTL = float(os.environ.get("TYPING_TTL", "8"))
+
+# /my_messages 에 보여줄 최근 대화 수
+INBOX_LIMIT = int(os.environ.get("INBOX_LIMIT", "100"))
+
+# 업로드 이미지 사본(thumb/card/full)을 만드는 백그라운드 스레드 수
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+# 업로드 제한: 이미지 한 장 / 요청 전체 크기(바이트), 한 번에 올릴 수 있는 장수
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", str(64 * 1024 * 1024)))
+MAX_ITEM_IMAGES = int(os.environ.get("MAX_ITEM_IMAGES", "10"))
+MAX_REVIEW_IMAGES = int(os.environ.get("MAX_REVIEW_IMAGES", "5"))
+
+# 목록/리뷰/찜 페이지 HTML 조각 캐시 최대 크기(바이트)
+FRAGMENT_CACHE_BYTES = int(os.environ.get("FRAGMENT_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# async 뷰에서 DB 호출을 돌리는 스레드 수 (ADB.gather 로 동시에 보낼 수 있는 읽기 수)
+ASYNC_DB_WORKERS = int(os.environ.get("ASYNC_DB_WORKERS", "16"))
+
+# Firebase REST 연결 풀: 보관할 keep-alive 연결 수, 연결/읽기 타임아웃(초),
+# 실패 시 재시도 횟수와 첫 백오프(초, 이후 2배씩 + 지터)
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.2"))
+
+# 운영 서버(gunicorn.conf.py / wsgi.py): 주소, 워커 프로세스 수, 워커당 스레드 수,
+# 요청 타임아웃(초).
+WEB_BIND = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", str(min((os.cpu_count() or 1) * 2 + 1, 8))))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "16"))
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", "30"))
+# gunicorn 워커 종류. gevent(pip install gevent)면 SSE 채팅 스트림이 스레드를 잡지 않고
+# 워커당 WEB_CONNECTIONS 개까지 동시에 열어 둘 수 있다. gthread 는 스트림 하나가 스레드 하나
+WEB_WORKER_CLASS = os.environ.get("WEB_WORKER_CLASS", "gevent")
+WEB_CONNECTIONS = int(os.environ.get("WEB_CONNECTIONS", "2000"))
+
+# 요청/DB 호출 계측 (METRICS=1): Server-Timing 헤더와 /debug/metrics (Prometheus).
+# METRICS_TOKEN 을 주면 /debug/metrics 는 Authorization: Bearer <토큰> 일 때만 응답
+METRICS_ENABLED = os.environ.get("METRICS", "0") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# 참조가 사라진 업로드 이미지라도 이 시간(초) 안에 올라왔거나 재사용된 파일은
+# 바로 지우지 않는다 (동시에 같은 사진을 올린 요청과 겹치지 않게). flask gc-images 가 나중에 정리
+IMAGE_GC_GRACE = int(os.environ.get("IMAGE_GC_GRACE", "600"))
@@ -1,9 +1,225 @@
-﻿import pyrebase
-import json
+﻿import json
+import os
+import atexit
 import datetime
-from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, auth
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import g, has_request_context
+
+import config as app_config
+import metrics as db_metrics
+import storage
+from chat_hub import ChatHub, make_broker
+from presence import PresenceTable, TypingStore, now_ms as presence_now_ms
+from uploads import CONTENT_NAME
+from catalog import (
+    NodeCatalog,
+    ITEM_SORT_KEYS,
+    ITEM_SEARCH_FIELDS,
+    REVIEW_SEARCH_FIELDS,
+)
+
+# ---------------------------------------------------------------------------
+# 요청 단위 읽기 메모
+#   한 요청 안에서 같은 읽기(같은 메서드 + 같은 인자)는 DB 에 한 번만 가고,
+#   쓰기가 일어나면 메모를 비운다. 메모와 호출 횟수는 flask.g 에 들고 있어서
+#   요청이 끝나면 같이 사라진다.
+# ---------------------------------------------------------------------------
+_prefetch_pool = ThreadPoolExecutor(
+    max_workers=app_config.DB_PREFETCH_WORKERS, thread_name_prefix="db-prefetch"
+)
+
+
+def _reset_prefetch_pool():
+    # fork 된 자식에는 부모의 작업 스레드가 없으므로 풀을 새로 만든다
+    global _prefetch_pool
+    _prefetch_pool = ThreadPoolExecutor(
+        max_workers=app_config.DB_PREFETCH_WORKERS, thread_name_prefix="db-prefetch"
+    )
+
+
+os.register_at_fork(after_in_child=_reset_prefetch_pool)
+
+# DB 호출 계측 (config.METRICS_ENABLED 일 때만 DBhandler/db 객체를 감싼다)
+METRICS = db_metrics.Metrics(enabled=app_config.METRICS_ENABLED)
+
+
+def _request_memo():
+    if not has_request_context():
+        return None
+    if "_db_memo" not in g:
+        g._db_memo = {}
+        g._db_stats = {"reads": 0, "writes": 0, "memo_hits": 0}
+    return g._db_memo
+
+
+def _memo_key(name, args, kwargs=None):
+    return (name,) + tuple(args) + tuple(sorted((kwargs or {}).items()))
+
+
+def _memoized_read(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        memo = _request_memo()
+        if memo is None:
+            return method(self, *args, **kwargs)
+        key = _memo_key(method.__name__, args, kwargs)
+        if key in memo:
+            g._db_stats["memo_hits"] += 1
+            return memo[key]
+        g._db_stats["reads"] += 1
+        value = method(self, *args, **kwargs)
+        memo[key] = value
+        return value
+    wrapper.memoized = True  # async_db 가 메모를 같이 쓰는지 확인할 때 사용
+    return wrapper
+
+
+def _writes(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        memo = _request_memo()
+        if memo is None or g.get("_db_in_write"):
+            return method(self, *args, **kwargs)
+
+        # 쓰기 메서드 안에서 부르는 다른 쓰기(batch_update 등)는 한 번으로 센다
+        memo.clear()
+        g._db_stats["writes"] += 1
+        g._db_in_write = True
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            g._db_in_write = False
+            memo.clear()
+    return wrapper
+
+
+def request_db_stats():
+    """현재 요청에서 DB 읽기/쓰기/메모 적중 횟수 (요청 밖이면 None)"""
+    if not has_request_context() or "_db_stats" not in g:
+        return None
+    return dict(g._db_stats)
+
+
+# 리뷰 별점 (숫자가 아니거나 0 이하면 통계에서 제외 → 0.0)
+def _review_rate(review_data):
+    try:
+        rate = float(review_data.get('rate', 0))
+    except (TypeError, ValueError):
+        return 0.0
+    return rate if rate > 0 else 0.0
+
+
+# 판매자별 별점 합계/개수 {seller: {"rate_sum", "review_count"}}
+# (지금 있는 상품의 리뷰만, 판매자는 상품의 seller 기준 — 삭제된 상품의 리뷰는 빠진다)
+def _seller_stats_from(all_items, all_reviews):
+    expected = {}
+    for item_name, review_data in (all_reviews or {}).items():
+        if not isinstance(review_data, dict):
+            continue
+        item_info = (all_items or {}).get(item_name)
+        if not isinstance(item_info, dict) or not item_info.get("seller"):
+            continue
+        rate = _review_rate(review_data)
+        if not rate:
+            continue
+        stat = expected.setdefault(item_info["seller"], {"rate_sum": 0.0, "review_count": 0})
+        stat["rate_sum"] += rate
+        stat["review_count"] += 1
+    return expected
+
+
+# user_transactions 에 저장하는 거래 한 건 (목록 화면에 필요한 상품 정보까지 같이)
+def _user_transaction_entry(status, seller_id, buyer_id, item_data):
+    item_data = item_data or {}
+    return {
+        "status": status,
+        "seller": seller_id,
+        "buyer": buyer_id,
+        "img_path": item_data.get("img_path", ""),
+        "price": item_data.get("price", ""),
+        "addr": item_data.get("addr", ""),
+    }
+
+
+def _message_data(sender_id, text, image_url=None):
+    return {
+        "sender": sender_id,
+        "text": text,
+        "image": image_url or "",
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+def _chat_link(conversation_id, item_name, other_user_id):
+    return {
+        "conversation_id": conversation_id,
+        "item_name": item_name,
+        "with_user": other_user_id
+    }
+
+
+# 이미지 참조: image_refs/{파일 해시}/{owner} = static 기준 경로 (예: "images/<해시>.jpg")
+#   owner 는 "item:<상품 이름>", "review:<상품 이름>", "chat:<대화 id>"
+#   내용 해시 이름으로 저장된 파일만 기록한다 (예전 uuid 이름 파일은 지우지 않음)
+def _image_key(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _image_ref_updates(owner, paths, add=True):
+    return {
+        f"image_refs/{_image_key(path)}/{owner}": (path if add else None)
+        for path in paths
+        if path and CONTENT_NAME.match(os.path.basename(path))
+    }
+
+
+def _item_images(info):
+    # 상품/리뷰가 쓰는 이미지 파일 이름 (img_paths 가 없던 예전 데이터는 img_path 하나)
+    if not isinstance(info, dict):
+        return []
+    names = info.get("img_paths") or [info.get("img_path")]
+    return [n for n in dict.fromkeys(names) if n]
+
+
+def _chat_image_path(image_url):
+    # "/static/chat_images/<name>" → "chat_images/<name>"
+    return image_url.split("/static/", 1)[-1] if image_url else None
+
+
+# 채팅 목록(user_chats)에 같이 저장하는 마지막 메시지 미리보기
+def _message_preview(text, image_url=None):
+    text = (text or "").strip()
+    if not text and image_url:
+        return "사진"
+    return text[:50]
+
+
+# 메시지 하나를 보낼 때 양쪽 채팅 목록(inbox)과 item_chats 에 쓸 경로들
+#   user_chats/{user}/{conv} = { conversation_id, item_name, with_user,
+#                                last_message, last_sender, last_at, unread, status }
+#   item_chats/{item}/{conv} = { user_id: True, ... }  (거래 상태가 바뀔 때 찾아갈 목록)
+def _inbox_updates(conversation_id, sender_id, other_user_id, item_name, preview, sent_at, status):
+    updates = {}
+    for user_id, with_user in ((sender_id, other_user_id), (other_user_id, sender_id)):
+        base = f"user_chats/{user_id}/{conversation_id}"
+        fields = dict(
+            _chat_link(conversation_id, item_name, with_user),
+            last_message=preview,
+            last_sender=sender_id,
+            last_at=sent_at,
+            status=status,
+        )
+        for k, v in fields.items():
+            updates[f"{base}/{k}"] = v
+        # 보낸 사람은 읽은 것으로, 받는 사람은 안 읽은 수 +1
+        updates[f"{base}/unread"] = 0 if user_id == sender_id else storage.increment(1)
+        updates[f"item_chats/{item_name}/{conversation_id}/{user_id}"] = True
+    return updates
+
 
 class DBhandler:
     # def __init__(self):
@@ -20,38 +236,182 @@ class DBhandler:
     #     print("✅ Firebase 연결 완료")
 
 
+    @_writes
     def delete_item(self, name):
-    # Firebase에서 'item' 밑의 해당 상품 노드 제거
-        self.db.child("item").child(name).remove()
-
-    def __init__(self):
-        with open('./authentication/firebase_auth.json') as f:
-            config = json.load(f)
-
-        # Firebase 연결 초기화
-        firebase = pyrebase.initialize_app(config)
-        self.db = firebase.database()
+    # Firebase에서 'item' 밑의 해당 상품 노드 제거 (판매자별 인덱스, 이미지 참조도 같이)
+        item = self.db.child("item").child(name).get().val() or {}
+        seller_id = item.get("seller")
+        images = [f"images/{p}" for p in _item_images(item)]
+        updates = {f"item/{name}": None}
+        if seller_id:
+            updates[f"seller_items/{seller_id}/{name}"] = None
+            # 삭제된 상품의 리뷰는 판매자 별점에서 빠진다
+            rate = _review_rate(self.db.child("review").child(name).get().val() or {})
+            if rate:
+                self._ensure_seller_stats(seller_id)
+                updates[f"seller_stats/{seller_id}/rate_sum"] = storage.increment(-rate)
+                updates[f"seller_stats/{seller_id}/review_count"] = storage.increment(-1)
+        updates.update(_image_ref_updates(f"item:{name}", images, add=False))
+        self.batch_update(updates)
+        self.catalog.discard(name)
+        self.release_images(images)
+
+    def __init__(self, backend=None, sqlite_path=None, on_images_released=None):
+        # 저장소 선택 (기본값은 config.DB_BACKEND)
+        self.backend = backend or app_config.DB_BACKEND
+        # Firebase 인증 파일은 Firebase 를 쓸 때만 읽는다
+        self.firebase_config = None
+        if self.backend == "firebase":
+            with open('./authentication/firebase_auth.json') as f:
+                self.firebase_config = json.load(f)
+        self.sqlite_path = sqlite_path or app_config.SQLITE_PATH
+        self._connect()
+        # gunicorn --preload 처럼 import 후 fork 하는 서버: 자식마다 연결을 새로 만든다
+        os.register_at_fork(after_in_child=self._after_fork)
+
+        # 목록 페이지용 item / review 트리 캐시 (정렬 인덱스 + 검색 색인 포함)
+        self.catalog = NodeCatalog(
+            self._load_items,
+            ttl=app_config.CATALOG_TTL,
+            sort_keys=ITEM_SORT_KEYS,
+            search_fields=ITEM_SEARCH_FIELDS,
+        )
+        self.review_catalog = NodeCatalog(
+            self._load_reviews,
+            ttl=app_config.CATALOG_TTL,
+            search_fields=REVIEW_SEARCH_FIELDS,
+        )
+
+        # 더 이상 아무도 참조하지 않는 이미지 경로 목록을 받아 파일을 지우는 함수
+        self.on_images_released = on_images_released
+
+        # 새 메시지/입력 중 상태를 /api/chat/stream 구독자에게 바로 전달
+        self.hub = ChatHub(
+            max_queue=app_config.CHAT_STREAM_QUEUE,
+            broker=make_broker(app_config.CHAT_BROKER_URL),
+        )
+
+        # 접속 시각은 메모리에만 갱신하고 user_status 에는 주기적으로 모아서 저장
+        self.presence = PresenceTable(
+            self._flush_presence,
+            flush_interval=app_config.PRESENCE_FLUSH_INTERVAL,
+            online_window=app_config.PRESENCE_ONLINE_WINDOW,
+            max_age=app_config.PRESENCE_CACHE_MAX_AGE,
+        )
+        atexit.register(self.presence.flush)
+
+        # seller_items 인덱스가 모든 상품을 담고 있는지 (rebuild-seller-items 후 True)
+        self._seller_index_ready = False
+
+        # 입력 중 상태는 DB 에 쓰지 않고 메모리에서 TTL 로 관리
+        self.typing = TypingStore(ttl=app_config.TYPING_TTL)
+        self.hub.on("typing", self._apply_typing)
+
+        if self.backend != "firebase":
+            print(f"✅ {self.backend} storage connected.")
+            return
         print("✅ Pyrebase (Web) connected.")
 
+    def _firebase_auth(self):
+        # Firebase Admin(토큰 발급)은 import 가 무거워서 처음 토큰을 만들 때 띄운다
+        import firebase_admin
+        from firebase_admin import credentials, auth
+
         # Initialize Firebase Admin (for creating tokens)
         if not firebase_admin._apps:
             cred = credentials.Certificate('./authentication/serviceAccountKey.json')
-            
+
             firebase_admin.initialize_app(cred, {
-                'databaseURL': config.get('databaseURL')
+                'databaseURL': self.firebase_config.get('databaseURL')
             })
             print("✅ Firebase Admin (Server) connected.")
+        return auth
+
+    def _connect(self):
+        # Firebase REST 호출용 keep-alive 연결 풀 (타임아웃/재시도 포함)
+        self.http = None
+        if self.backend == "firebase":
+            from http_pool import PooledSession
+
+            self.http = PooledSession(
+                pool_size=app_config.HTTP_POOL_SIZE,
+                connect_timeout=app_config.HTTP_CONNECT_TIMEOUT,
+                read_timeout=app_config.HTTP_READ_TIMEOUT,
+                retries=app_config.HTTP_RETRIES,
+                backoff=app_config.HTTP_RETRY_BACKOFF,
+            )
+        self.db = storage.connect(
+            self.backend,
+            firebase_config=self.firebase_config,
+            sqlite_path=self.sqlite_path,
+            http_session=self.http,
+        )
+        if METRICS.enabled:
+            self.db = db_metrics.InstrumentedRef(self.db, METRICS)
+
+    def _after_fork(self):
+        # 부모의 HTTPS 소켓 / SQLite 연결을 자식이 같이 쓰면 응답이 섞이거나 DB 가 깨진다.
+        # (:memory: 는 새로 열면 빈 DB 가 되므로 복사된 것을 그대로 쓴다)
+        if self.backend == "firebase" or self.sqlite_path != ":memory:":
+            self._connect()
+        self.presence.after_fork()
+
+    def ping(self):
+        """DB 까지 실제로 닿는지 (/readyz)"""
+        try:
+            self.db.child("user_status").order_by_key().limit_to_first(1).get()
+            return True
+        except Exception as e:
+            print(f"⚠️ DB ping failed: {e}")
+            return False
+
+    def http_stats(self):
+        """Firebase HTTP 연결 풀 통계 (SQLite 면 None)"""
+        if self.http is None:
+            return None
+        return self.http.stats.snapshot()
+
+    # 서로 관계없는 읽기 여러 개를 동시에 실행해서 요청 메모에 넣어 둔다
+    #   DB.prefetch((DB.get_item_byname, name), (DB.get_transaction_status, name))
+    # 이후 같은 호출은 메모에서 바로 나온다. 요청 밖에서는 아무것도 하지 않는다.
+    def prefetch(self, *calls):
+        memo = _request_memo()
+        if memo is None:
+            return
+
+        pending = {}
+        for fn, *args in calls:
+            key = _memo_key(fn.__name__, args)
+            if key not in memo and key not in pending:
+                # 작업 스레드에는 요청 컨텍스트가 없으므로 메모 없이 바로 읽는다
+                pending[key] = _prefetch_pool.submit(db_metrics.timed, fn, *args)
+
+        for key, future in pending.items():
+            g._db_stats["reads"] += 1
+            memo[key], seconds = future.result()
+            db_metrics.add_request_db(seconds)
+
+    # 여러 경로를 한 번에 쓰는 multi-location update
+    # {"item/a": {...}, "seller_items/s/a": {...}} 처럼 루트 기준 경로를 키로 준다.
+    # 왕복 한 번에 전부 반영되거나 전부 실패한다 (값이 None 이면 삭제).
+    @_writes
+    def batch_update(self, updates):
+        self.db.update(updates)
+        return True
 
     def create_custom_token(self, user_id):
+        if self.backend != "firebase":
+            return None
         try:
             # Create a token that expires in 1 hour 
-            custom_token = auth.create_custom_token(user_id, {'expiresIn': 3600})
+            custom_token = self._firebase_auth().create_custom_token(user_id, {'expiresIn': 3600})
             return custom_token.decode('utf-8')
         except Exception as e:
             print(f"❌ Error creating custom token: {e}")
             return None
 
     # [과제1] 상품 정보 삽입 함수
+    @_writes
     def insert_item(self, name, data, img_path):
         if isinstance(img_path, list):
             img_list = img_path
@@ -81,30 +441,67 @@ class DBhandler:
             "created_at": created_at,
         }
 
-        self.db.child("item").child(name).set(item_info)
+        # item/{name} 과 seller_items/{seller}/{name} 을 한 번의 multi-path update 로 저장
+        updates = {f"item/{name}": item_info}
+        old_item = self.db.child("item").child(name).get().val() or {}
+        old_seller = old_item.get("seller")
+        if old_seller and old_seller != item_info["seller"]:
+            updates[f"seller_items/{old_seller}/{name}"] = None
+        if item_info["seller"]:
+            updates[f"seller_items/{item_info['seller']}/{name}"] = item_info
+
+        # 같은 이름으로 다시 등록하면서 빠진 예전 사진은 참조를 지운다
+        images = [f"images/{p}" for p in img_list]
+        dropped = [f"images/{p}" for p in _item_images(old_item) if f"images/{p}" not in images]
+        updates.update(_image_ref_updates(f"item:{name}", dropped, add=False))
+        updates.update(_image_ref_updates(f"item:{name}", images))
+        self.batch_update(updates)
+        self.release_images(dropped)
+
+        self.catalog.put(name, item_info)
         print(f"✅ 상품 '{name}' 등록 완료")
         return True
 
-    # [과제2] ID 중복 체크 함수
-    def user_duplicate_check(self, id_string):
-        users = self.db.child("user").get()
+    # user/{id} 한 건만 읽어오는 조회 (전체 user 노드를 받지 않음)
+    @_memoized_read
+    def get_user_record(self, user_id):
+        if not user_id:
+            return None
 
-        # 첫 번째 회원가입일 경우(None)
-        if users.val() is None:
-            print("🆕 첫 사용자 등록")
-            return True
+        value = self.db.child("user").child(user_id).get().val()
+        if value:
+            return value
+
+        # 마이그레이션 전 레코드(user/{push_id}) 는 "id" 보조 인덱스로 찾는다
+        # (database.rules.json 의 user: {".indexOn": ["id"]} 필요)
+        # 실패를 "없음" 으로 보면 예전 계정의 ID 로 새로 가입할 수 있으므로 그대로 올린다
+        try:
+            matches = self.db.child("user").order_by_child("id").equal_to(user_id).get().each()
+        except Exception as e:
+            print(f"❌ user id 인덱스 조회 실패 (database.rules.json 배포 필요): {e}")
+            raise
+        for res in matches or []:
+            return res.val()
+        return None
 
+    # [과제2] ID 중복 체크 함수
+    # (조회 자체가 실패하면 None: 사용 가능하다고 하지 않는다)
+    def user_duplicate_check(self, id_string):
         # 이미 존재하는 id가 있는지 검사
-        for res in users.each():
-            value = res.val()
-            if value['id'] == id_string:
-                print(f"⚠️ 이미 존재하는 ID: {id_string}")
-                return False
+        try:
+            record = self.get_user_record(id_string)
+        except Exception:
+            return None
+        if record is not None:
+            print(f"⚠️ 이미 존재하는 ID: {id_string}")
+            return False
 
         print(f"✅ 사용 가능한 ID: {id_string}")
         return True
 
     # [과제2] 회원 등록 함수
+    # 성공 True, 중복/잘못된 ID False, ID 확인 실패 None
+    @_writes
     def insert_user(self, form_data, pw_hash):
         # 폼 명칭과 백엔드 키 맞추기 (userID 사용)
         user_id = form_data.get('userID', '').strip()
@@ -113,8 +510,17 @@ class DBhandler:
             print("❌ 회원가입 실패: userID 누락")
             return False
 
+        # user/{id} 키로 저장하므로 Firebase 키에 못 쓰는 문자는 막는다
+        if any(ch in user_id for ch in ".#$[]/"):
+            print(f"❌ 회원가입 실패 (사용할 수 없는 문자): {user_id}")
+            return False
+
         #중복 체크
-        if not self.user_duplicate_check(user_id):
+        available = self.user_duplicate_check(user_id)
+        if available is None:
+            print(f"❌ 회원가입 실패 (ID 확인 불가): {user_id}")
+            return None
+        if not available:
             print(f"❌ 회원가입 실패 (중복 ID): {user_id}")
             return False
 
@@ -123,68 +529,141 @@ class DBhandler:
             "id": user_id,
             "pw": pw_hash
         }
-        self.db.child("user").push(user_info)
+        # 동시에 같은 ID 로 가입하면 둘 다 중복 체크를 통과하므로,
+        # user/{id} 가 아직 비어 있을 때만 쓴다 (ETag 조건부 쓰기)
+        current = self.db.child("user").child(user_id).get_etag()
+        if current["value"] is not None:
+            print(f"❌ 회원가입 실패 (중복 ID): {user_id}")
+            return False
+        result = self.db.child("user").child(user_id).conditional_set(user_info, current["ETag"])
+        if isinstance(result, dict) and "ETag" in result:
+            print(f"❌ 회원가입 실패 (동시에 같은 ID 로 가입): {user_id}")
+            return False
         print(f"✅ 회원가입 완료: {user_id}")
         return True
 
     def find_user(self, id_, pw_):
-        users = self.db.child("user").get()
-        target_value=[]
-        for res in users.each():
-            value = res.val()
-            if value['id'] == id_ and value['pw'] == pw_:
-                return True
-        return False
+        try:
+            value = self.get_user_record(id_)
+        except Exception:
+            return False
+        return bool(value) and value.get('pw') == pw_
+
+    # 예전 user/{push_id} 레코드를 user/{id} 키로 옮기기 (flask migrate-users)
+    @_writes
+    def migrate_user_keys(self):
+        users = self.db.child("user").get().val() or {}
+        updates = {}
+        moved = 0
+
+        for key, value in users.items():
+            if not isinstance(value, dict):
+                continue
+            user_id = value.get("id")
+            if not user_id or key == user_id:
+                continue
+
+            # 같은 id 가 이미 새 형식으로 있으면 그쪽을 유지하고 예전 레코드만 지운다
+            if user_id not in users and user_id not in updates:
+                updates[user_id] = value
+                moved += 1
+            updates[key] = None
+
+        if updates:
+            # 한 번의 multi-path update 로 옮기기 + 지우기를 같이 반영
+            self.db.child("user").update(updates)
+
+        print(f"✅ user 키 마이그레이션 완료: {moved}건 이동")
+        return moved
     
     def get_items(self):
+        # 메모리 캐시에서 반환 (TTL 만료 또는 무효화 후에만 DB 에서 다시 읽음)
+        return self.catalog.get_items()
+
+    # 정렬 인덱스에서 한 페이지만: (rows, next_after, total)
+    def get_items_page(self, sort="latest", offset=0, limit=15, after=None):
+        return self.catalog.page(sort, offset=offset, limit=limit, after=after)
+
+    # 상품 이름/판매자/설명 검색 (sort 가 없으면 일치 정도 순)
+    def search_items(self, q, sort=None):
+        return self.catalog.search(q, sort)
+
+    def _load_items(self):
         items = self.db.child("item").get().val()
         return items
-    
-    def get_item_byname(self, name):
-        items = self.db.child("item").get()
-        target_value=""
-        print("###########",name)
-        for res in items.each():
-            key_value = res.key()
-            if key_value == name:
-                target_value=res.val()
-        return target_value
 
+    # 판매자가 거래완료로 표시 (/item/complete)
+    @_writes
+    def mark_item_sold(self, name, seller_id=None):
+        if seller_id is None:
+            seller_id = (self.get_item_byname(name) or {}).get("seller")
+        updates = {f"item/{name}/status": "sold"}
+        # 인덱스에 없는 상품(rebuild-seller-items 전)에 status 만 쓰면 빈 껍데기 항목이 생긴다
+        if seller_id and self.db.child("seller_items").child(seller_id).child(name).get().val():
+            updates[f"seller_items/{seller_id}/{name}/status"] = "sold"
+        updates.update(self._inbox_status_updates(name, "sold"))
+        self.batch_update(updates)
+        self.catalog.patch(name, {"status": "sold"})
+        return True
+    
     # Add a message to a conversation
+    @_writes
     def add_message(self, conversation_id, sender_id, text, image_url=None):
         try:
-            timestamp = datetime.utcnow().isoformat()
-            message_data = {
-                "sender": sender_id,
-                "text": text,
-                "image": image_url or "",
-                "timestamp": timestamp
-            }
-            
-            self.db.child("conversations").child(conversation_id).push(message_data)
+            message_id = storage.generate_push_id()
+            message_data = _message_data(sender_id, text, image_url)
+            self.db.child("conversations").child(conversation_id).child(message_id).set(message_data)
+            self.hub.publish(conversation_id, "message", dict(message_data, id=message_id), message_id)
             print(f"✅ Message sent to: {conversation_id}")
             return True
         except Exception as e:
             print(f"⚠️ Error sending message: {e}")
             return False
 
-#  Get all messages for a conversation
-    def get_messages(self, conversation_id):
+#  Get messages for a conversation
+    # limit/before/since 를 주면 push key(시간순) 기준으로 일부만 읽는다
+    #   before: 이 key 보다 이전 메시지 중 마지막 limit 개 (위로 스크롤해서 더 보기)
+    #   since : 이 key 이후 새 메시지 (limit 개까지)
+    #   둘 다 없으면 마지막 limit 개
+    # 반환값은 key 순서를 유지한 dict. limit 이 없으면 예전처럼 전체를 돌려준다.
+    @_memoized_read
+    def get_messages(self, conversation_id, limit=None, before=None, since=None):
         try:
-            messages = self.db.child("conversations").child(conversation_id).get().val()
-            
-            return messages or {}
+            ref = self.db.child("conversations").child(conversation_id)
+            if not (limit or before or since):
+                return ref.get().val() or {}
+
+            # 커서 메시지 자체는 빼야 하므로 하나 더 읽는다
+            query = ref.order_by_key()
+            extra = 1 if (before or since) else 0
+            if since:
+                query = query.start_at(since)
+                if limit:
+                    query = query.limit_to_first(limit + extra)
+            else:
+                if before:
+                    query = query.end_at(before)
+                if limit:
+                    query = query.limit_to_last(limit + extra)
+
+            messages = query.get().val() or {}
+            keys = [k for k in sorted(messages) if k != before and k != since]
+            if limit:
+                keys = keys[:limit] if since else keys[-limit:]
+            return {key: messages[key] for key in keys}
         except Exception as e:
             print(f"⚠️ Error fetching messages: {e}")
             return {}
         
+    # 지금 이후에 저장되는 메시지 key 가 모두 뒤에 오는 커서 (메시지가 없는 대화의 since 용).
+    # 메시지 key 는 Firebase 서버 시각으로 만들어지므로 시계 차이만큼 몇 초 앞당긴다
+    def chat_cursor(self):
+        return storage.push_id_cursor(time.time() - 5)
+
+    @_writes
     def link_user_to_conversation(self, user_id, conversation_id, item_name, other_user_id):
         try:
-            chat_info = {
-                "conversation_id": conversation_id,
-                "item_name": item_name,
-                "with_user": other_user_id
-            }
+            chat_info = _chat_link(conversation_id, item_name, other_user_id)
             # Save under "user_chats/USER_ID/CONVERSATION_ID"
             self.db.child("user_chats").child(user_id).child(conversation_id).set(chat_info)
             return True
@@ -192,90 +671,206 @@ class DBhandler:
             print(f"❌ Error linking user to chat: {e}")
             return False
 
+    # 메시지 저장 + 두 사용자의 채팅 목록 연결을 한 번의 multi-path update 로
+    # (add_message + link_user_to_conversation x2 를 왕복 3번 → 1번, 원자적으로)
+    @_writes
+    def send_message(self, conversation_id, sender_id, other_user_id, item_name, text, image_url=None):
+        try:
+            message_id = storage.generate_push_id()
+            message_data = _message_data(sender_id, text, image_url)
+            updates = _inbox_updates(
+                conversation_id, sender_id, other_user_id, item_name,
+                _message_preview(text, image_url),
+                presence_now_ms(),
+                self._inbox_status(item_name),
+            )
+            updates[f"conversations/{conversation_id}/{message_id}"] = message_data
+            updates.update(_image_ref_updates(f"chat:{conversation_id}", [_chat_image_path(image_url)]))
+            self.batch_update(updates)
+            self.hub.publish(conversation_id, "message", dict(message_data, id=message_id), message_id)
+            print(f"✅ Message sent to: {conversation_id}")
+            return message_id
+        except Exception as e:
+            print(f"⚠️ Error sending message: {e}")
+            return None
+
 
-    def get_user_conversations(self, user_id):
+    # 채팅 목록: user_chats/{user} 한 곳만, 최근 대화 순으로 limit 개까지 읽는다
+    # (상태/마지막 메시지/안 읽은 수는 메시지 전송과 거래 상태 변경 때 같이 저장됨)
+    # last_at 정렬은 database.rules.json 의 user_chats/$uid/.indexOn 이 있어야 한다
+    @_memoized_read
+    def get_user_conversations(self, user_id, limit=None):
         try:
-            conversations = self.db.child("user_chats").child(user_id).get().val()
+            ref = self.db.child("user_chats").child(user_id)
+            if limit:
+                ref = ref.order_by_child("last_at").limit_to_last(limit)
+            conversations = ref.get().val()
             if not conversations:
                 return {}
-            all_transactions = self.db.child("transactions").get().val() or {}
-            all_items = self.db.child("item").get().val() or {} # For legacy status
-
-            for conv_id, chat_data in conversations.items():
-                item_name = chat_data.get("item_name")
-                
-                # Check New System (transactions node)
-                trans_info = all_transactions.get(item_name)
-                if trans_info:
-                    chat_data["status"] = trans_info.get("status")
-                else:
-                    # Check Legacy System (item node)
-                    item_info = all_items.get(item_name)
-                    if item_info:
-                        chat_data["status"] = item_info.get("status", "active")
-                    else:
-                        chat_data["status"] = "unknown"
-            
-            return conversations
+
+            # 예전 형식(상태가 없는) 연결은 그 상품의 거래 상태만 따로 읽는다
+            legacy = [c for c in conversations.values() if isinstance(c, dict) and "status" not in c]
+            if legacy:
+                self.prefetch(*[(self._inbox_status, c.get("item_name")) for c in legacy])
+                for chat_data in legacy:
+                    chat_data["status"] = self._inbox_status(chat_data.get("item_name"))
+
+            ordered = sorted(
+                conversations.items(),
+                key=lambda kv: (kv[1].get("last_at") or 0) if isinstance(kv[1], dict) else 0,
+                reverse=True,
+            )
+            return dict(ordered)
         except Exception as e:
             print(f"❌ Error fetching user chats: {e}")
             return {}
-    
+
+    # 채팅 목록에 표시할 상품 상태 (거래 노드가 우선, 없으면 예전 item.status)
+    @_memoized_read
+    def _inbox_status(self, item_name):
+        status = self.get_transaction_status(item_name).get("status") or "active"
+        if status != "active":
+            return status
+        item_info = self.get_item_byname(item_name)
+        if not item_info:
+            return "unknown"
+        return "sold" if item_info.get("status") == "sold" else "active"
+
+    # 대화를 열었을 때 내 안 읽은 수를 0 으로
+    @_writes
+    def mark_conversation_read(self, user_id, conversation_id):
+        try:
+            link = self.db.child("user_chats").child(user_id).child(conversation_id).get().val()
+            if isinstance(link, dict) and link.get("unread"):
+                self.db.child("user_chats").child(user_id).child(conversation_id).update({"unread": 0})
+            return True
+        except Exception as e:
+            print(f"⚠️ Error marking chat read: {e}")
+            return False
+
+    # 상품의 거래 상태가 바뀌면 그 상품에 대한 모든 채팅 목록의 상태도 같이 고친다
+    def _inbox_status_updates(self, item_name, status):
+        chats = self.db.child("item_chats").child(item_name).get().val() or {}
+        updates = {}
+        for conversation_id, users in chats.items():
+            for user_id in (users or {}):
+                updates[f"user_chats/{user_id}/{conversation_id}/status"] = status
+        return updates
+
     # Delete a chat from a specific user's inbox
+    @_writes
     def delete_chat_link(self, user_id, conversation_id):
         try:
-            self.db.child("user_chats").child(user_id).child(conversation_id).remove()
+            link = self.db.child("user_chats").child(user_id).child(conversation_id).get().val() or {}
+            updates = {f"user_chats/{user_id}/{conversation_id}": None}
+            item_name = link.get("item_name")
+            if item_name:
+                updates[f"item_chats/{item_name}/{conversation_id}/{user_id}"] = None
+
+            # 상대방도 이미 나갔으면 대화 내용과 첨부 사진까지 정리한다
+            other = link.get("with_user")
+            images = []
+            if other and not self.db.child("user_chats").child(other).child(conversation_id).get().val():
+                messages = self.get_messages(conversation_id)
+                images = [
+                    _chat_image_path(m.get("image")) for m in messages.values()
+                    if isinstance(m, dict) and m.get("image")
+                ]
+                updates[f"conversations/{conversation_id}"] = None
+                updates.update(_image_ref_updates(f"chat:{conversation_id}", images, add=False))
+
+            self.batch_update(updates)
+            self.release_images(images)
             return True
         except Exception as e:
             print(f"❌ Error deleting chat link: {e}")
             return False
+
+    # 참조가 하나도 남지 않은 이미지는 파일을 지우도록 넘긴다
+    def release_images(self, paths):
+        orphans = []
+        for path in dict.fromkeys(p for p in paths if p and CONTENT_NAME.match(os.path.basename(p))):
+            refs = self.db.child("image_refs").child(_image_key(path)).get().val() or {}
+            if path not in refs.values():
+                orphans.append(path)
+        if orphans and self.on_images_released:
+            # 콜백이 실제로 지운 목록을 돌려주면 그것을 반환
+            removed = self.on_images_released(orphans)
+            if removed is not None:
+                return removed
+        return orphans
     # Set typing status for a conversation
+    # (갱신도 모두 발행해서 워커마다 가진 TypingStore 의 만료 시각을 같이 늘린다)
     def set_typing_status(self, conversation_id, sender_id, is_typing: bool):
-        try:
-            #  only store the status if it's True, remove if False.
-            if is_typing:
-                self.db.child("typing_status").child(conversation_id).child(sender_id).set(True)
-                print(f"Typing status set to TRUE for user {sender_id} in chat {conversation_id}")
-            else:
-                self.db.child("typing_status").child(conversation_id).child(sender_id).remove()
-                print(f" Typing status removed for user {sender_id} in chat {conversation_id}")
-            return True
-        except Exception as e:
-            print(f"⚠️ Error setting typing status: {e}")
-            return False
-            
+        self.hub.publish(conversation_id, "typing", {"user": sender_id, "is_typing": bool(is_typing)})
+        return True
+
+    # 모든 워커가 typing 이벤트를 받을 때 불린다: 자기 TypingStore 에 반영하고,
+    # 상태가 바뀔 때만 stream 구독자에게 알린다 (같은 상태 반복은 만료 시각만 연장)
+    def _apply_typing(self, conversation_id, data):
+        return self.typing.set(conversation_id, data["user"], data["is_typing"])
+
+    # 갱신 없이 ttl 이 지난 입력 중 상태를 지우고 "입력 끝남" 을 알린다
+    # (워커마다 같은 갱신을 받았으므로 각자 만료시키고 자기 구독자에게만 알린다)
+    def expire_typing(self):
+        for conversation_id, user_id in self.typing.sweep():
+            self.hub.publish_local(conversation_id, "typing", {"user": user_id, "is_typing": False})
+
     # Get typing status
     def get_typing_status(self, conversation_id):
-        try:
-            return self.db.child("typing_status").child(conversation_id).get().val() or {}
-        except Exception as e:
-            print(f"⚠️ Error getting typing status: {e}")
-            return {} 
-    
+        return self.typing.get(conversation_id)
+
     # Set user's last activity time
+    # (DB 에는 바로 쓰지 않고 presence 테이블에서 모아서 저장한다)
     def set_user_activity(self, user_id,timestamp=None):
-        try:
-            if timestamp is None:
-                utc_now = datetime.datetime.now(datetime.timezone.utc)
-                timestamp = int(round(utc_now.timestamp() * 1000))
-            self.db.child("user_status").child(user_id).update({"last_active": timestamp})
-            print(f"✅ Activity updated for user: {user_id}, last_active={timestamp}")
-            return True
-        except Exception as e:
-            print(f"⚠️ Error setting user activity: {e}")
-            return False
+        self.presence.touch(user_id, timestamp)
+        return True
+
+    # 바뀐 사용자들의 last_active 를 한 번의 multi-path update 로 저장
+    def _flush_presence(self, last_active):
+        self.batch_update({
+            f"user_status/{user_id}/last_active": timestamp
+            for user_id, timestamp in last_active.items()
+        })
             
     # Get a user's last activity time
+    @_memoized_read
     def get_user_activity(self, user_id):
+        # 최근에 확인한 값이면 메모리에서, 아니면 DB 값과 비교해 최근 값 (다른 워커의 핑 반영)
+        known = self.presence.known([user_id])
+        if user_id in known:
+            return known[user_id]
         try:
             status_data = self.db.child("user_status").child(user_id).get().val()
-            return status_data.get("last_active") if status_data else None
+            timestamp = status_data.get("last_active") if status_data else None
+            return self.presence.remember(user_id, timestamp)
         except Exception as e:
             print(f"⚠️ Error getting user activity: {e}")
             return None
 
+    # 여러 사용자의 접속 여부를 한 번에: {user_id: {"online": bool, "last_active": ms}}
+    # 메모리에 없거나 확인한 지 오래된 사용자만 DB 에서 (동시에) 읽는다
+    def get_online_users(self, user_ids):
+        user_ids = list(dict.fromkeys(u for u in user_ids if u))
+        last_active = self.presence.known(user_ids)
+        missing = [u for u in user_ids if u not in last_active]
+        if missing:
+            self.prefetch(*[(self.get_user_activity, u) for u in missing])
+            for u in missing:
+                last_active[u] = self.get_user_activity(u)
+
+        now = presence_now_ms()
+        return {
+            u: {
+                "online": self.presence.is_online(last_active.get(u), now),
+                "last_active": last_active.get(u),
+            }
+            for u in user_ids
+        }
+
 # 특정 유저의 특정 상품 하트 상태 가져오기
     # heart/{user_id}/{item} = {"interested": "Y" or "N"}
+    @_memoized_read
     def get_heart_byname(self, uid, name):
         snap = self.db.child("heart").child(uid).child(name).get()
         val = snap.val()
@@ -286,6 +881,7 @@ class DBhandler:
         return val
 
     # 하트 업데이트 (Y or N)
+    @_writes
     def update_heart(self, user_id, isHeart, item):
         heart_info = {
             "interested": isHeart
@@ -294,10 +890,12 @@ class DBhandler:
         return True
 
     # 찜목록 기능
+    @_writes
     def add_wishlist(self, user_id: str, product_key: str):
         self.db.child("wishlist").child(user_id).child(product_key).set(True)
         return True
 
+    @_writes
     def reg_review(self, data, img_path):
         review_info = {
             "title": data['title'],
@@ -310,7 +908,7 @@ class DBhandler:
         }
 
         # 1️⃣ 리뷰 저장
-        self.db.child("review").child(data['name']).set(review_info)
+        self.insert_review(data['name'], review_info)
 
         # 2️⃣ 판매자 평판 키워드 누적
         seller_id = data.get("seller")
@@ -325,6 +923,7 @@ class DBhandler:
         print(f" 리뷰 등록 및 판매자 평판 업데이트 완료: {seller_id}")
         return True
 
+    @_memoized_read
     def get_seller_feedback(self, seller_id):
         feedback = self.db.child("seller_feedback").child(seller_id).get().val() or {}
         if not feedback:
@@ -341,10 +940,63 @@ class DBhandler:
         return sorted_feedback
 
     
+    # review/{item_name} 저장 (리뷰 목록 캐시/검색 색인도 같이 갱신)
+    # (판매자별 별점 합계/개수 seller_stats 도 같은 multi-path update 로 증감)
+    @_writes
+    def insert_review(self, item_name, review_info):
+        updates = {f"review/{item_name}": review_info}
+
+        # 같은 상품 리뷰를 덮어쓰는 경우 예전 별점/사진 참조는 빼준다
+        old_review = self.db.child("review").child(item_name).get().val()
+        images = [f"images/{p}" for p in _item_images(review_info)]
+        dropped = [
+            f"images/{p}" for p in _item_images(old_review or {}) if f"images/{p}" not in images
+        ]
+        updates.update(_image_ref_updates(f"review:{item_name}", dropped, add=False))
+        updates.update(_image_ref_updates(f"review:{item_name}", images))
+        # 별점은 상품의 판매자에게 (상품이 지워졌으면 집계하지 않음, _seller_stats_from 과 같은 기준)
+        deltas = {}
+        seller_id = self.db.child("item").child(item_name).child("seller").get().val()
+        if seller_id:
+            old_rate = _review_rate(old_review) if isinstance(old_review, dict) else 0.0
+            new_rate = _review_rate(review_info)
+            deltas[seller_id] = (new_rate - old_rate, bool(new_rate) - bool(old_rate))
+
+        # 구매자 거래 목록에 리뷰 작성 표시 (리뷰 가능 목록에서 빠지도록)
+        buyer_id = self.db.child("transactions").child(item_name).child("buyer").get().val()
+        if buyer_id:
+            updates[f"user_transactions/{buyer_id}/{item_name}/reviewed"] = True
+
+        for seller_id, (sum_delta, count_delta) in deltas.items():
+            if sum_delta or count_delta:
+                self._ensure_seller_stats(seller_id)
+                updates[f"seller_stats/{seller_id}/rate_sum"] = storage.increment(sum_delta)
+                updates[f"seller_stats/{seller_id}/review_count"] = storage.increment(count_delta)
+
+        self.batch_update(updates)
+        self.release_images(dropped)
+        self.review_catalog.put(item_name, review_info)
+        return True
+
     def get_reviews(self):
+        return self.review_catalog.get_items()
+
+    def _load_reviews(self):
         reviews = self.db.child("review").get().val()
         return reviews
+
+    # 상품 이름/리뷰 제목/작성자 검색 (일치 정도 순)
+    def search_reviews(self, q):
+        return self.review_catalog.search(q)
+
+    # 목록 데이터 버전 (상품/리뷰가 바뀌면 올라감, HTML 조각 캐시 키에 사용)
+    def items_version(self):
+        return self.catalog.current_version()
+
+    def reviews_version(self):
+        return self.review_catalog.current_version()
     
+    @_memoized_read
     def get_review_byname(self, name):
         reviews = self.db.child("review").get()
         target_value=""
@@ -355,34 +1007,18 @@ class DBhandler:
                 target_value=res.val()
         return target_value
 
+    @_memoized_read
     def get_seller_review_stats(self, seller_id):
         try:
-            all_items = self.db.child("item").get().val() or {}
-            seller_items = [
-                name for name, info in all_items.items()
-                if isinstance(info, dict) and info.get('seller') == seller_id
-            ]
-
-            if not seller_items:
-                return {"average_rating": 0.0, "total_reviews": 0}
-
-            all_reviews = self.db.child("review").get().val() or {}
-            
-            total_rate = 0
-            review_count = 0
-            
-            for item_name in seller_items:
-                review_data = all_reviews.get(item_name)
-                if isinstance(review_data, dict):
-                    try:
-                        rate = float(review_data.get('rate', 0))
-                        if rate > 0:
-                            total_rate += rate
-                            review_count += 1
-                    except ValueError:
-                        pass
-
-            if review_count == 0:
+            # 리뷰 등록 때 누적해 둔 seller_stats/{seller} 한 건만 읽는다
+            # (배포 전 리뷰만 있는 판매자는 아직 없으므로 한 번 계산해서 만든다)
+            stats = self.db.child("seller_stats").child(seller_id).get().val()
+            if stats is None:
+                stats = self._ensure_seller_stats(seller_id)
+            total_rate = float(stats.get("rate_sum", 0) or 0)
+            review_count = int(stats.get("review_count", 0) or 0)
+
+            if review_count <= 0:
                 return {"average_rating": 0.0, "total_reviews": 0}
 
             average_rating = total_rate / review_count
@@ -395,43 +1031,95 @@ class DBhandler:
         except Exception as e:
             print(f"❌ Error getting seller review stats for {seller_id}: {e}")
             return {"average_rating": 0.0, "total_reviews": 0}
-        
-
-    def update_transaction_status(self, item_name, status, buyer_id=None):
-        update_data = {
-            "status": status  # "reserved" or "sold"
-        }
-        if buyer_id:
-            update_data["buyer"] = buyer_id
-        self.db.child("transactions").child(item_name).update(update_data)
-        return True
-
-    def get_transaction_status(self, item_name):
-        data = self.db.child("transactions").child(item_name).get().val()
-        
-        if not data:
-            return {"status": "active", "buyer": None}
-            
-        return data
-
 
-    def get_items_by_seller(self, seller_id):
+    # seller_stats/{seller} 가 없으면 지금 있는 상품/리뷰로 계산해서 만든다.
+    # 증감(increment)을 없는 노드에 하면 예전 리뷰가 빠진 값이 되므로 증감 전에 부른다.
+    # (비어 있을 때만 쓰므로 동시에 불려도 한 번만 만들어진다)
+    def _ensure_seller_stats(self, seller_id):
+        ref = self.db.child("seller_stats").child(seller_id)
+        current = ref.get_etag()
+        if current["value"] is not None:
+            return current["value"]
+        stats = _seller_stats_from(self.catalog.get_items(), self.review_catalog.get_items()).get(
+            seller_id, {"rate_sum": 0.0, "review_count": 0}
+        )
+        result = self.db.child("seller_stats").child(seller_id).conditional_set(stats, current["ETag"])
+        if isinstance(result, dict) and "ETag" in result:
+            return result["value"] or stats
+        return stats
+
+    # item / review 전체로 seller_stats 를 처음부터 다시 계산해서 비교
+    # (flask check-seller-stats [--fix])
+    @_writes
+    def check_seller_stats(self, fix=False):
         all_items = self.db.child("item").get().val() or {}
-        my_items = {}
-        for name, info in all_items.items():
-            if info.get("seller") == seller_id:
-                my_items[name] = info
-        return my_items
+        all_reviews = self.db.child("review").get().val() or {}
+        stored = self.db.child("seller_stats").get().val() or {}
+
+        expected = _seller_stats_from(all_items, all_reviews)
+
+        mismatches = {}
+        for seller_id in set(expected) | set(stored):
+            want = expected.get(seller_id, {"rate_sum": 0.0, "review_count": 0})
+            have = stored.get(seller_id) or {}
+            if (
+                int(have.get("review_count", 0) or 0) != want["review_count"]
+                or abs(float(have.get("rate_sum", 0) or 0) - want["rate_sum"]) > 1e-6
+            ):
+                mismatches[seller_id] = {"stored": have, "expected": want}
+
+        if fix and mismatches:
+            self.db.child("seller_stats").set(expected)
+        print(f"{'🔧' if fix else '🔍'} seller_stats 불일치: {len(mismatches)}명")
+        return mismatches
+        
 
+    # seller_items/{seller} 인덱스에서 그 판매자의 상품만 읽는다.
+    # rebuild-seller-items 를 돌리기 전에는 인덱스에 새 상품만 있을 수 있으므로
+    # item 캐시의 그 판매자 상품과 합친다
+    @_memoized_read
     def get_items_by_seller(self, seller_id):
+        if not seller_id:
+            return {}
+        my_items = self.db.child("seller_items").child(seller_id).get().val() or {}
+        if not self._seller_items_built():
+            legacy = {
+                name: info for name, info in self.catalog.get_items().items()
+                if isinstance(info, dict) and info.get("seller") == seller_id
+            }
+            my_items = dict(legacy, **my_items)
+        return {name: info for name, info in my_items.items() if isinstance(info, dict)}
+
+    # rebuild-seller-items 가 끝났는지 (한 번 끝나면 다시 읽지 않는다)
+    def _seller_items_built(self):
+        if not self._seller_index_ready:
+            self._seller_index_ready = bool(self.db.child("meta").child("seller_items_built").get().val())
+        return self._seller_index_ready
+
+    # 기존 item 데이터로 seller_items 인덱스를 다시 만든다 (flask rebuild-seller-items)
+    @_writes
+    def rebuild_seller_items(self):
         all_items = self.db.child("item").get().val() or {}
-        my_items = {}
+        index = {}
         for name, info in all_items.items():
-            if info.get("seller") == seller_id:
-                my_items[name] = info
-        return my_items
+            if isinstance(info, dict) and info.get("seller"):
+                index.setdefault(info["seller"], {})[name] = info
+
+        self.db.child("seller_items").set(index)
+        # 이제 인덱스만 믿어도 된다 (get_items_by_seller 가 item 캐시와 합치지 않음)
+        self.db.child("meta").child("seller_items_built").set(True)
+        print(f"✅ seller_items 재생성 완료: 판매자 {len(index)}명")
+        return len(index)
     
 
+    # 판매자 id 만 필요할 때 (판매자는 바뀌지 않으므로 목록 캐시에서 먼저 찾는다)
+    def get_item_seller(self, name):
+        item = self.catalog.get_item(name)
+        if not isinstance(item, dict):
+            item = self.get_item_byname(name)
+        return item.get("seller") if item else None
+
+    @_memoized_read
     def get_item_byname(self, name):
         try:
             item_data = self.db.child("item").child(name).get().val()
@@ -441,10 +1129,12 @@ class DBhandler:
             return {}
         
 
+    @_writes
     def update_transaction_status(self, item_name, status, buyer_id=None):
         # find out who the seller is from the item data
         item_data = self.db.child("item").child(item_name).get().val()
         seller_id = item_data.get("seller") if item_data else None
+        old_data = self.db.child("transactions").child(item_name).get().val() or {}
 
         update_data = {
             "status": status,    # "reserved" or "sold"
@@ -452,56 +1142,58 @@ class DBhandler:
         }
         if buyer_id:
             update_data["buyer"] = buyer_id
-            
-        self.db.child("transactions").child(item_name).update(update_data)
+        buyer_id = buyer_id or old_data.get("buyer")
+
+        updates = {f"transactions/{item_name}/{k}": v for k, v in update_data.items()}
+
+        # user_transactions/{user}/{item}: 판매자/구매자 각자의 거래 목록
+        # (마이페이지, 리뷰 가능 목록이 전체 거래를 훑지 않도록)
+        entry = _user_transaction_entry(status, seller_id, buyer_id, item_data)
+        for uid in (seller_id, buyer_id):
+            if uid:
+                for k, v in entry.items():
+                    updates[f"user_transactions/{uid}/{item_name}/{k}"] = v
+
+        # 예약 구매자가 바뀐 경우 예전 구매자 목록에서는 뺀다
+        old_buyer = old_data.get("buyer")
+        if old_buyer and old_buyer not in (buyer_id, seller_id):
+            updates[f"user_transactions/{old_buyer}/{item_name}"] = None
+
+        updates.update(self._inbox_status_updates(item_name, status))
+        self.batch_update(updates)
         return True
 
+    @_memoized_read
     def get_transaction_status(self, item_name):
         data = self.db.child("transactions").child(item_name).get().val()
         if not data:
             return {"status": "active", "buyer": None}
         return data
 
+    @_memoized_read
     def get_transactions_by_user(self, user_id):
-        # Get all transactions
-        all_trans = self.db.child("transactions").get().val() or {}
+        # 내 거래 목록(user_transactions/{user})만 읽는다
+        my_trans = self.db.child("user_transactions").child(user_id).get().val() or {}
         user_trans = {}
 
-        # Get all items (to get image, price, etc.)
-        all_items = self.db.child("item").get().val() or {}
-
-        for item_name, trans_info in all_trans.items():
+        for item_name, trans_info in my_trans.items():
             # Only care about SOLD items
-            if trans_info.get("status") == "sold":
-                buyer = trans_info.get("buyer")
-                seller = trans_info.get("seller")
-
-                # If I am the Buyer OR the Seller
-                if buyer == user_id or seller == user_id:
-                    item_details = all_items.get(item_name, {})
-                    combined = dict(trans_info)
-                    combined.update(item_details)
-                    
-                    user_trans[item_name] = combined
+            if isinstance(trans_info, dict) and trans_info.get("status") == "sold":
+                user_trans[item_name] = dict(trans_info)
 
         return user_trans
 
+    @_memoized_read
     def get_items_for_review(self, buyer_id):
         """
-        transactions/{item_name} = { buyer: ..., status: ... }
-        review/{item_name} 가 없고,
-        transactions의 buyer가 현재 로그인 유저인 item들만 골라서
+        user_transactions/{buyer_id}/{item_name} = { buyer: ..., status: ..., reviewed: ... }
+        에서 아직 리뷰(reviewed)가 없고 buyer가 현재 로그인 유저인 item들만 골라서
         (item_name, item_info) 리스트로 반환
         """
-        # 거래 정보
-        txs = self.db.child("transactions").get().val() or {}
-        # 상품 정보
-        items_all = self.db.child("item").get().val() or {}
-        # 리뷰 정보
-        reviews_all = self.db.child("review").get().val() or {}
+        my_trans = self.db.child("user_transactions").child(buyer_id).get().val() or {}
 
         result = []
-        for item_name, tx in txs.items():
+        for item_name, tx in my_trans.items():
             if not isinstance(tx, dict):
                 continue
 
@@ -512,16 +1204,111 @@ class DBhandler:
                 continue
 
             # 이미 리뷰가 있으면 스킵
-            if reviews_all and reviews_all.get(item_name):
+            if tx.get("reviewed"):
                 continue
 
-            item_info = items_all.get(item_name)
-            if not item_info:
+            # 삭제된 상품은 스킵 (상품 존재 여부는 item 캐시로 확인)
+            if not self.catalog.get_item(item_name):
                 continue
 
-            result.append((item_name, item_info))
+            result.append((item_name, tx))
 
         return result
-        
 
+    # 기존 user_chats 에 마지막 메시지/상태를 채우고 item_chats 를 다시 만든다
+    # (flask rebuild-inbox)
+    @_writes
+    def rebuild_inbox(self):
+        all_chats = self.db.child("user_chats").get().val() or {}
+        updates = {}
+        last = {}
+        for user_id, chats in all_chats.items():
+            for conversation_id, link in (chats or {}).items():
+                if not isinstance(link, dict):
+                    continue
+                item_name = link.get("item_name")
+                if conversation_id not in last:
+                    messages = self.get_messages(conversation_id, limit=1)
+                    last[conversation_id] = next(iter(messages.values()), None)
+                msg = last[conversation_id]
+
+                base = f"user_chats/{user_id}/{conversation_id}"
+                updates[f"{base}/status"] = self._inbox_status(item_name)
+                updates[f"{base}/unread"] = link.get("unread", 0)
+                if isinstance(msg, dict):
+                    updates[f"{base}/last_message"] = _message_preview(msg.get("text"), msg.get("image"))
+                    updates[f"{base}/last_sender"] = msg.get("sender")
+                    try:
+                        # 메시지 timestamp 는 UTC 기준 isoformat
+                        sent_at = datetime.fromisoformat(msg.get("timestamp", "")).replace(tzinfo=timezone.utc)
+                        updates[f"{base}/last_at"] = int(sent_at.timestamp() * 1000)
+                    except ValueError:
+                        pass
+                if item_name:
+                    updates[f"item_chats/{item_name}/{conversation_id}/{user_id}"] = True
+
+        self.batch_update(updates)
+        print(f"✅ 채팅 목록 재생성 완료: 사용자 {len(all_chats)}명")
+        return len(all_chats)
+
+    # transactions / item / review 전체로 user_transactions 를 다시 만든다
+    # (flask rebuild-user-transactions)
+    @_writes
+    def rebuild_user_transactions(self):
+        txs = self.db.child("transactions").get().val() or {}
+        items_all = self.db.child("item").get().val() or {}
+        reviews_all = self.db.child("review").get().val() or {}
 
+        index = {}
+        for item_name, tx in txs.items():
+            if not isinstance(tx, dict):
+                continue
+            item_info = items_all.get(item_name)
+            if not isinstance(item_info, dict):
+                continue  # 삭제된 상품은 목록에 넣지 않는다
+            entry = _user_transaction_entry(
+                tx.get("status"), tx.get("seller"), tx.get("buyer"), item_info
+            )
+            if reviews_all.get(item_name):
+                entry["reviewed"] = True
+            for uid in (tx.get("seller"), tx.get("buyer")):
+                if uid:
+                    index.setdefault(uid, {})[item_name] = dict(entry)
+
+        self.db.child("user_transactions").set(index)
+        print(f"✅ user_transactions 재생성 완료: 사용자 {len(index)}명")
+        return len(index)
+
+
+if METRICS.enabled:
+    # http_stats 는 /debug/metrics 가 부르는 것이라 제외
+    db_metrics.instrument_methods(DBhandler, METRICS, exclude=("http_stats",))
+
+
+class LazyDBhandler:
+    """처음 쓸 때 DBhandler 를 만드는 대리 객체.
+
+    import 만으로 자격 증명 파일을 읽거나 연결을 열지 않으므로 CLI/테스트/새로
+    뜨는 워커의 시작이 빠르다. gunicorn --preload 로 띄우면 마스터는 DB 를 만들지
+    않고, 워커마다 첫 요청에서 자기 연결을 만든다.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+        self._handler = None
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self._handler is not None
+
+    def get(self):
+        if self._handler is None:
+            with self._lock:
+                if self._handler is None:
+                    self._handler = DBhandler(*self._args, **self._kwargs)
+        return self._handler
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
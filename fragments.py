@@ -0,0 +1,86 @@
+"""렌더링된 HTML 조각 캐시.
+
+/list, /review, /wishlist 의 본문(content 블록)은 로그인한 사람이 누구든 같은
+데이터면 같은 HTML 이다. 그래서 (경로, 검색어, 정렬, 페이지, 데이터 버전) 을
+키로 본문 HTML 을 캐시해 두고, 요청마다는 머리말(로그인 표시 등)이 있는
+index.html 껍데기만 새로 렌더링한다. 로그인하지 않은 요청은 페이지 전체를
+캐시에서 바로 돌려준다.
+
+데이터 버전은 상품/리뷰 캐시(NodeCatalog.version)가 바뀔 때마다 올라가므로
+쓰기가 일어나면 예전 키는 더 이상 쓰이지 않고, LRU 로 밀려나 사라진다.
+업로드 이미지의 크기별 사본을 아직 만드는 중이면(원본 URL 이 들어감) 그 HTML 은
+캐시하지 않는다 (app.render_cached).
+"""
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+def render_block(template_name, block_name, **context):
+    """템플릿의 블록 하나만 렌더링 (render_template 과 같은 전역 변수 사용)"""
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return "".join(template.blocks[block_name](template.new_context(context)))
+
+
+class FragmentCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key → (value, size)
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, str):
+            return len(value.encode("utf-8"))
+        return sum(len(v.encode("utf-8")) for v in value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return  # 한 조각이 전체 한도보다 크면 캐시하지 않는다
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            # 한도를 넘으면 가장 오래 안 쓴 것부터 버린다
+            while self.size > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,58 @@
+"""gunicorn 설정: gunicorn -c gunicorn.conf.py wsgi:application
+
+값은 config.py 의 WEB_* (환경 변수로 변경) 를 따른다.
+
+워커는 기본이 gevent (pip install gevent) 다. /api/chat/stream 의 SSE 연결은
+대화창이 열려 있는 동안 계속 살아 있어서, gthread 워커에서는 스트림 하나가
+스레드 하나를 잡고(워커당 WEB_THREADS 개) 그만큼 다른 요청을 못 받는다.
+gevent 워커는 연결마다 greenlet 을 쓰므로 워커당 WEB_CONNECTIONS 개까지 열어 둔다.
+gevent 가 없으면 gthread 로 띄운다.
+
+gevent 는 워커가 fork 된 뒤에 표준 라이브러리(socket, threading, queue ...)를
+바꿔 끼우므로, 그 전에 만들어진 락/스레드 풀이 남지 않도록 preload_app 을 끈다
+(import 는 가볍다: DB 는 첫 요청에서 연결, LazyDBhandler). gthread 일 때는
+preload_app 으로 마스터가 한 번만 import 하고, 이미 연결된 뒤에 fork 되더라도
+os.register_at_fork 로 자식에서 HTTPS 연결 풀, SQLite 연결, 작업 스레드 풀을 새로
+만들므로 워커끼리 연결을 같이 쓰지 않는다.
+
+채팅 이벤트는 CHAT_BROKER_URL(Redis)로 모든 워커에 돌린다 (chat_hub.py 참고).
+목록 캐시는 워커 프로세스마다 따로다.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config as app_config  # noqa: E402
+
+worker_class = app_config.WEB_WORKER_CLASS
+if worker_class == "gevent":
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("⚠️ gevent 가 없어서 gthread 워커로 실행 (채팅 스트림 하나가 스레드 하나를 씀)")
+        worker_class = "gthread"
+
+bind = app_config.WEB_BIND
+workers = app_config.WEB_WORKERS
+threads = app_config.WEB_THREADS
+worker_connections = app_config.WEB_CONNECTIONS
+# 두 워커 모두 요청이 아니라 워커 자체의 생존 신호로 timeout 을 보므로
+# 오래 열려 있는 SSE 스트림도 끊기지 않는다
+timeout = app_config.WEB_TIMEOUT
+graceful_timeout = app_config.WEB_TIMEOUT
+keepalive = 5
+preload_app = worker_class == "gthread"
+
+accesslog = "-"
+errorlog = "-"
+
+if workers > 1 and not app_config.CHAT_BROKER_URL:
+    print("⚠️ CHAT_BROKER_URL 이 없어서 채팅 실시간 전달이 같은 워커에 붙은 사람끼리만 된다")
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        server.log.info("worker %s ready (gevent, connections=%s)", worker.pid, worker_connections)
+    else:
+        server.log.info("worker %s ready (threads=%s)", worker.pid, threads)
@@ -0,0 +1,155 @@
+"""Firebase REST 호출용 HTTP 연결 풀.
+
+pyrebase 는 requests.Session 하나를 모든 Database 객체가 같이 쓰지만, 기본
+HTTPAdapter 는 호스트당 연결 10개까지만 보관하고, 타임아웃도 재시도도 없다.
+스레드가 10개를 넘으면 남는 연결은 버려지고 다음 요청에서 TLS 핸드셰이크를
+다시 하게 된다.
+
+PooledSession 은 pyrebase 의 세션 자리에 그대로 끼워 넣는 Session 으로,
+  - 연결 풀 크기를 설정값으로 (keep-alive 연결을 그만큼 보관)
+  - 호출마다 연결/읽기 타임아웃
+  - 연결 실패, 429, 5xx 는 지수 백오프 + 지터(full jitter)로 재시도
+    (POST 는 push, PATCH 는 .sv increment 가 들어 있을 수 있어서 같은 변경이 두 번
+     반영될 수 있으므로 연결 전 실패만)
+  - 요청 수 / 새 연결 수 / 재사용 비율 / 재시도 / 실패 횟수 통계
+를 제공한다.
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+# 같은 요청을 다시 보내도 결과가 같은 메서드 (Firebase REST 기준)
+# PATCH 는 빠진다: batch_update 가 {".sv": {"increment": n}} 을 PATCH 로 보내므로
+# 서버가 이미 처리한 요청을 다시 보내면 카운터가 두 번 오른다.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _never_connected(error):
+    # 요청을 보내기 전에 실패했는지 (연결 타임아웃, 연결 거부, DNS 실패)
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            }
+
+
+def _counting_pool(base, stats):
+    # 새 TCP(+TLS) 연결을 만들 때마다 센다. 풀에 있던 연결을 쓰면 불리지 않는다.
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.add("new_connections")
+            return super()._new_conn()
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, stats, pool_size=10):
+        self.stats = stats
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class PooledSession(requests.Session):
+    def __init__(self, pool_size=32, connect_timeout=3.05, read_timeout=15,
+                 retries=2, backoff=0.2, backoff_max=2.0):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.stats = PoolStats()
+
+        adapter = PooledAdapter(self.stats, pool_size=pool_size)
+        for scheme in ("http://", "https://"):
+            self.mount(scheme, adapter)
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+        # 429/503 에 Retry-After(초)가 있으면 그만큼은 기다린다
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+        self.stats.add("retries")
+        time.sleep(delay)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            self.stats.add("requests")
+            try:
+                response = super().request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # ConnectTimeout 도 여기에 포함 (연결 전 실패는 POST/PATCH 도 다시 보내도 안전)
+                connect_failed = _never_connected(e)
+                if isinstance(e, requests.exceptions.Timeout):
+                    self.stats.add("timeouts")
+                if attempt < self.retries and (idempotent or connect_failed):
+                    self._sleep_before_retry(attempt)
+                    attempt += 1
+                    continue
+                self.stats.add("errors")
+                raise
+            except requests.exceptions.Timeout:
+                # 읽기 타임아웃: 서버가 이미 처리했을 수 있으므로 멱등 요청만 재시도
+                self.stats.add("timeouts")
+                if attempt < self.retries and idempotent:
+                    self._sleep_before_retry(attempt)
+                    attempt += 1
+                    continue
+                self.stats.add("errors")
+                raise
+            finally:
+                self.stats.add("total_ms", (time.perf_counter() - start) * 1000)
+
+            if response.status_code in RETRY_STATUSES and idempotent and attempt < self.retries:
+                response.close()  # 본문을 읽지 않은 연결도 풀로 돌려보낸다
+                self._sleep_before_retry(attempt, response)
+                attempt += 1
+                continue
+            if response.status_code >= 500:
+                self.stats.add("errors")
+            return response
@@ -0,0 +1,175 @@
+"""업로드 이미지 크기별 변환(thumb / card / full).
+
+상품 등록 때 올린 원본(수 MB 짜리 PNG 도 있음)을 목록 카드에 그대로 쓰면
+페이지 하나에 수십 MB 가 내려간다. 업로드가 끝나면 백그라운드 스레드에서
+크기별로 줄인 WebP(안 되면 JPEG) 사본을 static/images/variants/ 에 만들고,
+템플릿은 image_url(파일명, "card") 로 있으면 사본을, 아직 없으면 원본을 쓴다.
+
+사본은 EXIF 등 메타데이터 없이 저장한다 (촬영 위치 같은 정보가 빠짐).
+Pillow 가 없으면 변환 없이 항상 원본을 쓴다.
+"""
+import functools
+import importlib.util
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Pillow 는 import 가 무거워서 실제로 변환할 때 불러온다 (없으면 변환 없이 원본 사용)
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+# 이름 → 가로/세로 최대 크기(px)
+VARIANTS = {
+    "thumb": (200, 200),
+    "card": (480, 480),
+    "full": (1600, 1600),
+}
+VARIANT_DIR = "variants"
+# 원본이 올라온 지 이 시간(초)이 안 됐는데 사본이 없으면 아직 만드는 중으로 본다
+PENDING_SECONDS = 300
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+
+
+@functools.lru_cache(maxsize=None)
+def _output_format():
+    if HAS_PILLOW:
+        from PIL import features
+
+        if features.check("webp"):
+            return "WEBP", ".webp"
+    return "JPEG", ".jpg"
+
+
+def variant_filename(filename, variant):
+    """images/ 기준 상대 경로 (예: variants/abc_card.webp)"""
+    stem, _ = os.path.splitext(filename)
+    return f"{VARIANT_DIR}/{stem}_{variant}{_output_format()[1]}"
+
+
+class ImageProcessor:
+    def __init__(self, image_dir, workers=2):
+        self.image_dir = image_dir
+        self.enabled = HAS_PILLOW
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        os.register_at_fork(after_in_child=self._after_fork)
+        self._lock = threading.Lock()
+        self._ready = set()  # 사본이 있는 것으로 확인된 (filename, variant)
+        self._failed = set()  # 변환에 실패한 원본 (기다려도 사본이 생기지 않음)
+
+        self.processed = 0
+        self.failed = 0
+
+    def _after_fork(self):
+        # fork 된 자식에는 부모의 작업 스레드가 없다
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+
+    def submit(self, filenames):
+        """원본 파일들의 사본 생성을 예약 (요청은 기다리지 않음)"""
+        if not self.enabled:
+            return []
+        return [self._pool.submit(self.process, name) for name in filenames if name]
+
+    def process(self, filename):
+        from PIL import Image, ImageOps
+
+        src = os.path.join(self.image_dir, filename)
+        fmt, _ = _output_format()
+        os.makedirs(os.path.join(self.image_dir, VARIANT_DIR), exist_ok=True)
+
+        # 같은 사진(같은 파일 이름)을 다시 올린 경우 이미 만든 사본을 그대로 쓴다
+        if all(self.url_path(filename, v) != filename for v in VARIANTS):
+            return True
+        try:
+            with Image.open(src) as original:
+                # 휴대폰 사진은 EXIF 회전값대로 돌려 놓고 나서 메타데이터는 버린다
+                image = ImageOps.exif_transpose(original)
+                has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+                if fmt == "JPEG" or not has_alpha:
+                    image = image.convert("RGB")
+                else:
+                    image = image.convert("RGBA")
+
+                for variant, size in VARIANTS.items():
+                    resized = image.copy()
+                    resized.thumbnail(size, Image.LANCZOS)
+                    dest = os.path.join(self.image_dir, variant_filename(filename, variant))
+                    tmp = f"{dest}.{threading.get_ident()}.tmp"
+                    if fmt == "WEBP":
+                        resized.save(tmp, fmt, quality=80, method=4)
+                    else:
+                        resized.save(tmp, fmt, quality=82, optimize=True, progressive=True)
+                    os.replace(tmp, dest)  # 반쯤 쓴 파일을 내보내지 않도록
+                    with self._lock:
+                        self._ready.add((filename, variant))
+        except Exception as e:
+            print(f"⚠️ Error processing image {filename}: {e}")
+            with self._lock:
+                self.failed += 1
+                self._failed.add(filename)
+            return False
+
+        with self._lock:
+            self.processed += 1
+        return True
+
+    def url_path(self, filename, variant):
+        """static/images 기준 경로: 사본이 있으면 사본, 없으면 원본"""
+        if not filename or not self.enabled or variant not in VARIANTS:
+            return filename
+        key = (filename, variant)
+        with self._lock:
+            if key in self._ready:
+                return variant_filename(filename, variant)
+        path = variant_filename(filename, variant)
+        if os.path.exists(os.path.join(self.image_dir, path)):
+            with self._lock:
+                self._ready.add(key)
+            return path
+        return filename
+
+    def pending(self, filename):
+        """사본을 아직 만드는 중인지 (다른 워커가 만드는 중이어도 원본 시각으로 판단)"""
+        if not filename or not self.enabled:
+            return False
+        with self._lock:
+            if filename in self._failed:
+                return False
+        try:
+            mtime = os.path.getmtime(os.path.join(self.image_dir, filename))
+        except OSError:
+            return False
+        return time.time() - mtime < PENDING_SECONDS
+
+    def remove_variants(self, filename):
+        for variant in VARIANTS:
+            try:
+                os.remove(os.path.join(self.image_dir, variant_filename(filename, variant)))
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self._ready.discard((filename, variant))
+
+    def missing(self):
+        """사본이 아직 없는 원본 파일 목록 (flask generate-image-variants)"""
+        names = []
+        for name in sorted(os.listdir(self.image_dir)):
+            if not os.path.isfile(os.path.join(self.image_dir, name)):
+                continue
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            if any(
+                not os.path.exists(os.path.join(self.image_dir, variant_filename(name, v)))
+                for v in VARIANTS
+            ):
+                names.append(name)
+        return names
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "processed": self.processed,
+                "failed": self.failed,
+                "ready": len(self._ready),
+            }
@@ -0,0 +1,273 @@
+"""요청/DB 호출 계측 (config.METRICS_ENABLED 일 때만).
+
+  - DBhandler 공개 메서드마다 호출 수와 걸린 시간(히스토그램)
+  - 실제 저장소 호출(get/set/update/push/remove)마다 트리 경로별 호출 수, 시간,
+    주고받은 데이터 크기(JSON 바이트 기준 추정값)
+  - 라우트별 처리 시간, 응답의 Server-Timing 헤더(app / db)
+  - /debug/metrics 에서 Prometheus text 형식으로 내보냄
+
+트리 경로는 첫 노드 이름만 남기고 나머지 키는 * 로 바꾼다 (item/*, user_chats/*/*).
+통계는 워커 프로세스마다 따로 쌓인다 (라벨 pid 로 구분).
+
+끄면 DBhandler 와 db 객체를 감싸지 않으므로 비용이 없다.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context
+
+# 초 단위 히스토그램 구간 (Firebase 왕복은 보통 30~300ms)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "market_db_method_calls_total": ("counter", "DBhandler 메서드 호출 수"),
+    "market_db_method_seconds": ("histogram", "DBhandler 메서드 처리 시간"),
+    "market_db_ops_total": ("counter", "저장소 호출 수 (트리 경로별)"),
+    "market_db_op_seconds": ("histogram", "저장소 호출 시간 (트리 경로별)"),
+    "market_db_bytes_total": ("counter", "저장소와 주고받은 데이터 크기 (JSON 바이트 추정)"),
+    "market_db_errors_total": ("counter", "예외로 끝난 저장소 호출 수"),
+    "market_http_requests_total": ("counter", "라우트별 요청 수"),
+    "market_http_request_seconds": ("histogram", "라우트별 요청 처리 시간"),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (name, labels) → 값
+        self._histograms = {}                # (name, labels) → Histogram
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] += amount
+
+    def observe(self, name, labels, seconds):
+        with self._lock:
+            hist = self._histograms.get((name, labels))
+            if hist is None:
+                hist = self._histograms[(name, labels)] = Histogram()
+            hist.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, gauges=None):
+        """Prometheus text 형식. gauges 는 {이름: {라벨 tuple: 값}}"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()
+            }
+
+        pid = _labels(pid=os.getpid())
+        by_name = defaultdict(list)
+        for (name, labels), value in counters.items():
+            by_name[name].append((labels, value))
+        for (name, labels), value in histograms.items():
+            by_name[name].append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                labels = labels + pid
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, values in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labels + pid)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# 요청 단위 DB 시간 (Server-Timing 의 db 항목)
+# ---------------------------------------------------------------------------
+def start_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_db = [0.0, 0]  # [초, 호출 수]
+
+
+def add_request_db(seconds, calls=1):
+    """현재 요청의 DB 시간에 더한다 (요청 밖/작업 스레드에서는 무시)"""
+    if has_request_context() and "_metrics_db" in g:
+        g._metrics_db[0] += seconds
+        g._metrics_db[1] += calls
+
+
+def timed(fn, *args, **kwargs):
+    """(결과, 걸린 초) — 요청 컨텍스트가 없는 작업 스레드에서 잰 시간을 나중에 더할 때"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def finish_request(metrics, request, response):
+    start = g.pop("_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    db_seconds, db_calls = g.pop("_metrics_db", (0.0, 0))
+
+    route = request.url_rule.rule if request.url_rule else "(unmatched)"
+    labels = _labels(route=route, method=request.method, status=response.status_code)
+    metrics.inc("market_http_requests_total", labels)
+    metrics.observe("market_http_request_seconds", _labels(route=route, method=request.method), elapsed)
+
+    response.headers.add(
+        "Server-Timing",
+        f'app;dur={elapsed * 1000:.1f}, db;dur={db_seconds * 1000:.1f};desc="{db_calls} calls"',
+    )
+
+
+# ---------------------------------------------------------------------------
+# DBhandler 메서드 / 저장소 호출 감싸기
+# ---------------------------------------------------------------------------
+def instrument_methods(cls, metrics, exclude=()):
+    """cls 의 공개 메서드를 호출 수/시간을 재는 함수로 바꾼다"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or name in exclude:
+            continue
+        if not callable(attr) or isinstance(attr, (staticmethod, classmethod)):
+            continue
+        setattr(cls, name, _timed_method(attr, metrics))
+    return cls
+
+
+def _timed_method(method, metrics):
+    labels = _labels(method=method.__name__)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.inc("market_db_method_calls_total", labels)
+            metrics.observe("market_db_method_seconds", labels, time.perf_counter() - start)
+    return wrapper
+
+
+def path_label(segments):
+    if not segments:
+        return "/"
+    return "/".join([segments[0]] + ["*"] * (len(segments) - 1))
+
+
+def _payload_size(value):
+    if value is None:
+        return 0
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+class InstrumentedRef:
+    """pyrebase 모양의 db 객체를 감싸서 get/set/update/push/remove 를 잰다.
+
+    child() 는 경로를 기억한 새 래퍼를 돌려주고, 쿼리 메서드(order_by_*,
+    limit_to_* 등)는 같은 경로의 래퍼를 돌려준다.
+    """
+
+    _OPS = {"get", "set", "update", "push", "remove"}
+
+    def __init__(self, ref, metrics, segments=()):
+        self._ref = ref
+        self._metrics = metrics
+        self._segments = segments
+
+    def child(self, *args):
+        parts = tuple(p for arg in args for p in str(arg).split("/") if p)
+        return InstrumentedRef(self._ref.child(*args), self._metrics, self._segments + parts)
+
+    def __getattr__(self, name):
+        attr = getattr(self._ref, name)
+        if name in self._OPS:
+            return functools.partial(self._call, name, attr)
+        if not callable(attr):
+            return attr
+
+        def query(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # 쿼리 메서드는 ref 를 돌려준다 (pyrebase 는 자기 자신)
+            if hasattr(result, "child") and hasattr(result, "get"):
+                return InstrumentedRef(result, self._metrics, self._segments)
+            return result
+        return query
+
+    def _call(self, op, fn, *args, **kwargs):
+        labels = _labels(op=op, path=path_label(self._segments))
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._metrics.inc("market_db_errors_total", labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._metrics.inc("market_db_ops_total", labels)
+            self._metrics.observe("market_db_op_seconds", labels, elapsed)
+            add_request_db(elapsed)
+
+        if op == "get":
+            size = _payload_size(result.val() if hasattr(result, "val") else result)
+            self._metrics.inc("market_db_bytes_total", labels + (("direction", "in"),), size)
+        elif args:
+            size = _payload_size(args[0])
+            self._metrics.inc("market_db_bytes_total", labels + (("direction", "out"),), size)
+        return result
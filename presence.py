@@ -0,0 +1,184 @@
+"""접속 상태(presence) / 입력 중(typing) 메모리 테이블.
+
+채팅창이 열린 탭마다 30초에 한 번 /api/user/active 를 부르는데, 이걸 매번
+user_status 에 바로 쓰면 접속자 수만큼 DB 쓰기가 늘어난다. 마지막 접속 시각은
+여기 메모리에만 갱신해 두고, flush_interval 마다 바뀐 사용자만 모아서
+한 번에 저장한다.
+
+읽을 때는 메모리 값을 max_age 초 동안만 믿는다. 워커 프로세스가 여러 개면 같은
+사용자의 핑이 다른 워커로 갈 수 있으므로, 그보다 오래된 값은 user_status 를 다시
+읽어서 둘 중 최근 값을 쓴다.
+
+입력 중 상태는 아예 DB 에 저장하지 않고 TypingStore 에 TTL 을 두고 들고 있다.
+"""
+import threading
+import time
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class PresenceTable:
+    def __init__(self, flush, flush_interval=10, online_window=300, max_age=30):
+        # flush: {user_id: last_active(ms)} 를 받아 DB 에 저장하는 함수
+        self._flush = flush
+        self.flush_interval = flush_interval
+        self.online_window = online_window
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._last_active = {}
+        self._checked = {}  # user_id → 값을 마지막으로 확인한 시각(monotonic)
+        self._dirty = {}
+        self._flusher = None
+
+        self.touches = 0
+        self.flushes = 0
+        self.flushed_users = 0
+
+    def touch(self, user_id, timestamp=None):
+        timestamp = timestamp or now_ms()
+        with self._lock:
+            self.touches += 1
+            self._checked[user_id] = time.monotonic()
+            if timestamp >= self._last_active.get(user_id, 0):
+                self._last_active[user_id] = timestamp
+                self._dirty[user_id] = timestamp
+        if self.flush_interval <= 0:
+            self.flush()  # 0 이면 예전처럼 바로 저장
+        else:
+            self._start_flusher()
+
+    def remember(self, user_id, timestamp):
+        """DB 에서 읽어 온 값 (저장할 필요 없음). 메모리 값과 비교해 최근 값을 돌려준다"""
+        with self._lock:
+            self._checked[user_id] = time.monotonic()
+            if timestamp is not None and timestamp > self._last_active.get(user_id, 0):
+                self._last_active[user_id] = timestamp
+            return self._last_active.get(user_id)
+
+    def known(self, user_ids):
+        """max_age 안에 확인한 사용자만 {user_id: last_active (없으면 None)}"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                u: self._last_active.get(u)
+                for u in user_ids
+                if now - self._checked.get(u, float("-inf")) < self.max_age
+            }
+
+    def is_online(self, timestamp, now=None):
+        if not timestamp:
+            return False
+        return (now or now_ms()) - timestamp <= self.online_window * 1000
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        try:
+            self._flush(dirty)
+        except Exception as e:
+            print(f"⚠️ Error flushing presence: {e}")
+            with self._lock:
+                # 실패한 건 다음 번에 다시 (그 사이 새로 들어온 값이 우선)
+                for user_id, ts in dirty.items():
+                    self._dirty.setdefault(user_id, ts)
+            return 0
+        with self._lock:
+            self.flushes += 1
+            self.flushed_users += len(dirty)
+        return len(dirty)
+
+    def after_fork(self):
+        # fork 된 자식에는 flush 스레드가 없다 (다음 touch 때 새로 띄운다)
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run, name="presence-flush", daemon=True
+            )
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._last_active),
+                "pending": len(self._dirty),
+                "touches": self.touches,
+                "flushes": self.flushes,
+                "flushed_users": self.flushed_users,
+            }
+
+
+class TypingStore:
+    """대화별 "입력 중" 사용자. ttl 초 동안 갱신이 없으면 자동으로 빠진다."""
+
+    def __init__(self, ttl=8):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expires = {}  # {conversation_id: {user_id: 만료 시각}}
+
+        self.toggles = 0
+        self.changes = 0
+
+    def set(self, conversation_id, user_id, is_typing):
+        """상태가 실제로 바뀌었으면 True (같은 상태를 또 보내면 만료 시각만 연장)"""
+        now = time.monotonic()
+        with self._lock:
+            self.toggles += 1
+            users = self._expires.get(conversation_id, {})
+            if is_typing:
+                changed = users.get(user_id, 0) <= now
+                self._expires.setdefault(conversation_id, {})[user_id] = now + self.ttl
+            else:
+                # 만료됐지만 아직 sweep 전인 항목도 "입력 끝남" 을 알려야 한다
+                changed = user_id in users
+                if changed:
+                    del users[user_id]
+                    if not users:
+                        del self._expires[conversation_id]
+            if changed:
+                self.changes += 1
+            return changed
+
+    def get(self, conversation_id):
+        """{user_id: True} (예전 typing_status 노드와 같은 모양)"""
+        now = time.monotonic()
+        with self._lock:
+            users = self._expires.get(conversation_id, {})
+            return {u: True for u, expires in users.items() if expires > now}
+
+    def sweep(self):
+        """만료된 항목을 지우고 [(conversation_id, user_id), ...] 로 돌려준다"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for conversation_id, users in list(self._expires.items()):
+                for user_id, expires in list(users.items()):
+                    if expires <= now:
+                        del users[user_id]
+                        expired.append((conversation_id, user_id))
+                if not users:
+                    del self._expires[conversation_id]
+        return expired
+
+    def stats(self):
+        with self._lock:
+            return {
+                "conversations": len(self._expires),
+                "toggles": self.toggles,
+                "changes": self.changes,
+            }
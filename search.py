@@ -0,0 +1,111 @@
+"""상품/리뷰 검색용 역색인(inverted index).
+
+한글은 띄어쓰기 단위로 자르면 "반팔티" 안의 "반팔" 같은 부분 검색이 안 되므로
+글자 단위 n-gram(1글자 + 2글자)으로 색인한다. 검색어의 2-gram 을 모두 가진
+문서만 후보로 뽑은 뒤, 실제로 포함되는지 확인하면서 점수를 매긴다.
+"""
+import re
+from collections import defaultdict
+
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    # 소문자 + 특수문자는 공백으로 (한글은 \w 에 포함됨)
+    return _NON_WORD.sub(" ", str(text or "").lower()).strip()
+
+
+def ngrams(text):
+    grams = set()
+    for word in text.split():
+        grams.update(word)
+        grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+def _query_grams(q):
+    # 검색어 단어가 1글자면 1-gram, 아니면 2-gram 만 써서 후보를 좁힌다
+    grams = set()
+    for word in q.split():
+        if len(word) == 1:
+            grams.add(word)
+        else:
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+class SearchIndex:
+    def __init__(self, fields):
+        # fields: {필드 이름: 가중치}, "$key" 는 노드 키(상품 이름 등) 자체
+        self.fields = fields
+        self._postings = defaultdict(set)
+        self._docs = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, key, info):
+        self.remove(key)
+        doc = {}
+        for field in self.fields:
+            value = key if field == "$key" else info.get(field, "")
+            text = normalize(value)
+            if text:
+                doc[field] = text
+        self._docs[key] = doc
+        for gram in ngrams(" ".join(doc.values())):
+            self._postings[gram].add(key)
+
+    def remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for gram in ngrams(" ".join(doc.values())):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[gram]
+
+    def _score(self, doc, q, words):
+        score = 0.0
+        for field, weight in self.fields.items():
+            text = doc.get(field)
+            if not text:
+                continue
+            if text == q:
+                score += weight * 4
+            elif text.startswith(q):
+                score += weight * 3
+            elif q in text:
+                score += weight * 2
+            elif all(w in text for w in words):
+                # 단어 순서가 달라도 모두 들어 있으면 낮은 점수로 포함
+                score += weight
+        return score
+
+    def search(self, query):
+        """[(key, score), ...] 점수 높은 순 (동점이면 key 순)"""
+        q = normalize(query)
+        if not q:
+            return []
+
+        grams = _query_grams(q)
+        postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+        if not postings or not postings[0]:
+            return []
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return []
+
+        words = q.split()
+        results = []
+        for key in candidates:
+            score = self._score(self._docs[key], q, words)
+            if score > 0:
+                results.append((key, score))
+        results.sort(key=lambda kv: (-kv[1], kv[0]))
+        return results
@@ -409,8 +409,16 @@ function initChatFeature() {
   const bodyElement = document.body;
 
   let currentFileToSend = null;
-  let currentConversationRef = null;
-  let currentMessageListener = null;
+  let chatStream = null;
+  let typingTimer = null;
+  let isTyping = false;
+
+  // 처음엔 최근 메시지만 받고, 위로 스크롤하면 이전 메시지를 서버에서 더 가져온다
+  // (한 페이지 크기는 서버 설정 CHAT_PAGE_SIZE 를 따른다)
+  let renderedMessageIds = new Set();
+  let oldestMessageId = null;
+  let hasOlderMessages = false;
+  let loadingOlderMessages = false;
 
   // --- TRANSACTION LOGIC ---
   function checkTransactionStatus() {
@@ -553,8 +561,7 @@ function initChatFeature() {
   }
 
   // --- MESSAGE LOGIC ---
-  function addMessage(content, senderId) {
-    if (!messagesContainer) return;
+  function buildMessageRow(content, senderId) {
     const role = senderId === CURRENT_USER_ID ? "sender" : "receiver";
     const { text, imageURL } = content;
     const row = document.createElement("div");
@@ -588,10 +595,64 @@ function initChatFeature() {
       row.appendChild(bubble);
       row.appendChild(avatar);
     }
-    messagesContainer.appendChild(row);
+    return row;
+  }
+
+  function addMessage(content, senderId) {
+    if (!messagesContainer) return;
+    messagesContainer.appendChild(buildMessageRow(content, senderId));
     scrollToBottom(document.querySelector(".chat-body"));
   }
 
+  function clearSystemMessage() {
+    const systemMsg = messagesContainer.querySelector(".chat-system-message");
+    if (systemMsg) systemMsg.remove();
+  }
+
+  // 새 메시지 하나 (Firebase child_added) → 이미 그린 건 건너뛰고 아래에 붙인다
+  function renderIncomingMessage(id, msg) {
+    if (!msg || renderedMessageIds.has(id)) return;
+    clearSystemMessage();
+    renderedMessageIds.add(id);
+    if (!oldestMessageId || id < oldestMessageId) oldestMessageId = id;
+    addMessage({ text: msg.text, imageURL: msg.image || null }, msg.sender);
+  }
+
+  // 이전 메시지 한 페이지를 위에 끼워 넣는다 (스크롤 위치는 그대로 유지)
+  function loadOlderMessages() {
+    if (!hasOlderMessages || loadingOlderMessages || !oldestMessageId) return;
+    loadingOlderMessages = true;
+
+    const chatBody = document.querySelector(".chat-body");
+    const params = new URLSearchParams({
+      before: oldestMessageId,
+      with: RECEIVER_ID,
+    });
+
+    fetch(`/api/chat/history/${encodeURIComponent(ITEM_NAME)}?${params}`)
+      .then((res) => res.json())
+      .then((page) => {
+        if (page.error) throw new Error(page.error);
+        const prevHeight = chatBody ? chatBody.scrollHeight : 0;
+        const fragment = document.createDocumentFragment();
+        page.messages.forEach((msg) => {
+          if (renderedMessageIds.has(msg.id)) return;
+          renderedMessageIds.add(msg.id);
+          fragment.appendChild(
+            buildMessageRow({ text: msg.text, imageURL: msg.image || null }, msg.sender)
+          );
+        });
+        messagesContainer.insertBefore(fragment, messagesContainer.firstChild);
+        if (page.oldest) oldestMessageId = page.oldest;
+        hasOlderMessages = page.has_more;
+        if (chatBody) chatBody.scrollTop = chatBody.scrollHeight - prevHeight;
+      })
+      .catch((e) => console.error("Failed to load older messages", e))
+      .finally(() => {
+        loadingOlderMessages = false;
+      });
+  }
+
   function scrollToBottom(containerElement) {
     if (!containerElement) return;
     requestAnimationFrame(() => {
@@ -625,37 +686,94 @@ function initChatFeature() {
       startStatusListener(RECEIVER_ID);
     }
 
-    currentConversationRef = database.ref("conversations/" + conversationId);
-    if (currentMessageListener) {
-      currentConversationRef.off("value", currentMessageListener);
-    }
-    if (messagesContainer) messagesContainer.innerHTML = "Loading...";
-
-    currentMessageListener = currentConversationRef.on("value", (snapshot) => {
-      if (!messagesContainer) return;
-      messagesContainer.innerHTML = "";
-      const messages = snapshot.val();
-      if (messages) {
-        Object.keys(messages).forEach((key) => {
-          const msg = messages[key];
-          addMessage(
-            { text: msg.text, imageURL: msg.image || null },
-            msg.sender
-          );
-        });
-      } else {
-        messagesContainer.innerHTML =
-          "<div class='chat-system-message'>대화가 시작되었습니다.</div>";
-      }
-      scrollToBottom(document.querySelector(".chat-body"));
+    stopChatStream();
+    if (!messagesContainer) return;
+    messagesContainer.innerHTML =
+      "<div class='chat-system-message'>대화가 시작되었습니다.</div>";
+    renderedMessageIds = new Set();
+    oldestMessageId = null;
+    hasOlderMessages = false;
+
+    // 최근 한 페이지만 받아서 그리고, 이후에는 서버가 새 메시지만 하나씩 밀어준다
+    const params = new URLSearchParams({ with: RECEIVER_ID });
+    fetch(`/api/chat/history/${encodeURIComponent(ITEM_NAME)}?${params}`)
+      .then((res) => res.json())
+      .then((page) => {
+        if (page.error) throw new Error(page.error);
+        page.messages.forEach((msg) => renderIncomingMessage(msg.id, msg));
+        hasOlderMessages = page.has_more;
+        startChatStream(page.newest);
+      })
+      .catch((e) => {
+        console.error("Failed to load chat history", e);
+        startChatStream(null);
+      });
+  }
+
+  // --- SERVER PUSH (SSE) ---
+  function startChatStream(sinceId) {
+    const params = new URLSearchParams({ with: RECEIVER_ID });
+    if (sinceId) params.set("since", sinceId);
+    chatStream = new EventSource(
+      `/api/chat/stream/${encodeURIComponent(ITEM_NAME)}?${params}`
+    );
+    chatStream.addEventListener("message", (e) => {
+      const msg = JSON.parse(e.data);
+      renderIncomingMessage(msg.id, msg);
+      if (msg.sender !== CURRENT_USER_ID) showTypingIndicator(false);
+    });
+    chatStream.addEventListener("typing", (e) => {
+      const data = JSON.parse(e.data);
+      if (data.user !== CURRENT_USER_ID) showTypingIndicator(data.is_typing);
     });
   }
 
-  function closeChat() {
-    if (currentConversationRef && currentMessageListener) {
-      currentConversationRef.off("value", currentMessageListener);
-      currentMessageListener = null;
+  function stopChatStream() {
+    if (chatStream) {
+      chatStream.close();
+      chatStream = null;
     }
+    showTypingIndicator(false);
+  }
+
+  function showTypingIndicator(visible) {
+    const indicator = document.getElementById("typing-indicator");
+    if (!indicator) return;
+    const nameEl = indicator.querySelector(".user-id");
+    if (nameEl && RECEIVER_ID) nameEl.textContent = `@${RECEIVER_ID}`;
+    indicator.style.display = visible ? "block" : "none";
+  }
+
+  // 입력 중이면 true 를 보내고(계속 입력하면 서버 TTL 이 끝나기 전에 한 번씩 다시),
+  // 3초 동안 입력이 없으면 false
+  let lastTypingSentAt = 0;
+  function sendTypingStatus(typing) {
+    const now = Date.now();
+    if (isTyping === typing && !(typing && now - lastTypingSentAt > 5000)) return;
+    isTyping = typing;
+    lastTypingSentAt = now;
+    fetch(`/api/chat/typing/${encodeURIComponent(ITEM_NAME)}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ is_typing: typing, other_user_id: OTHER_USER_ID || null }),
+    }).catch(() => {});
+  }
+
+  function handleTypingInput() {
+    sendTypingStatus(true);
+    clearTimeout(typingTimer);
+    typingTimer = setTimeout(() => sendTypingStatus(false), 3000);
+  }
+
+  function closeChat() {
+    stopChatStream();
+    fetch(`/api/chat/read/${encodeURIComponent(ITEM_NAME)}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ other_user_id: RECEIVER_ID }),
+    }).catch(() => {});
+    clearTimeout(typingTimer);
+    sendTypingStatus(false);
     chatModal.style.display = "none";
     bodyElement.classList.remove("no-scroll");
   }
@@ -721,6 +839,12 @@ function initChatFeature() {
       openChat();
     });
   }
+  const chatBodyEl = document.querySelector(".chat-body");
+  if (chatBodyEl) {
+    chatBodyEl.addEventListener("scroll", () => {
+      if (chatBodyEl.scrollTop === 0) loadOlderMessages();
+    });
+  }
   const closeBtn = document.getElementById("close-chat-btn");
   if (closeBtn) {
     closeBtn.addEventListener("click", closeChat);
@@ -735,9 +859,12 @@ function initChatFeature() {
     chatInput.addEventListener("keydown", (e) => {
       if (e.key === "Enter") {
         e.preventDefault();
+        clearTimeout(typingTimer);
+        sendTypingStatus(false);
         handleSend();
       }
     });
+    chatInput.addEventListener("input", handleTypingInput);
   }
   //  for Image Sending
   if (photoBtn && fileInput) {
@@ -0,0 +1,537 @@
+"""DBhandler 아래에서 실제 데이터를 읽고 쓰는 저장소(backend) 모음.
+
+DBhandler는 pyrebase의 child() 체인 API
+(self.db.child("item").child(name).get().val(), .set(), .update(), .push(), .remove())
+로만 데이터를 다룬다. 여기 있는 SQLite 구현도 같은 모양의 API를 제공하므로
+config.DB_BACKEND 값만 바꾸면 Firebase 없이 앱 전체를 로컬에서 돌릴 수 있다.
+"""
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+
+
+# 최상위 노드별 테이블 정의
+#   depth   : 몇 단계의 키까지 테이블 컬럼(k0, k1, ...)으로 펼칠지
+#   indexes : 값(JSON) 안에서 조회에 자주 쓰는 필드 → 표현식 인덱스 생성
+NODES = {
+    "item": {"depth": 1, "indexes": ("seller", "created_at")},
+    "user": {"depth": 1, "indexes": ("id",)},
+    "review": {"depth": 1, "indexes": ("seller", "user")},
+    "transactions": {"depth": 1, "indexes": ("buyer", "seller", "status")},
+    "conversations": {"depth": 2, "indexes": ("timestamp",)},    # conv_id / push_id
+    "user_chats": {"depth": 2, "indexes": ("last_at",)},         # user / conv_id
+    "item_chats": {"depth": 2, "indexes": ()},                   # item / conv_id
+    "heart": {"depth": 2, "indexes": ()},                        # user / item
+    "wishlist": {"depth": 2, "indexes": ()},                     # user / item
+    "seller_feedback": {"depth": 1, "indexes": ()},
+    "user_status": {"depth": 1, "indexes": ()},
+    "typing_status": {"depth": 2, "indexes": ()},                # conv_id / user
+    "seller_items": {"depth": 2, "indexes": ()},                 # seller / item
+    "seller_stats": {"depth": 1, "indexes": ()},
+    "user_transactions": {"depth": 2, "indexes": ()},            # user / item
+    "image_refs": {"depth": 1, "indexes": ()},                   # 이미지 해시 -> {owner: 경로}
+}
+
+# 위에 없는 노드는 첫 번째 키까지만 펼쳐서 저장
+DEFAULT_NODE = {"depth": 1, "indexes": ()}
+
+_NODE_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+# ---------------------------------------------------------------------------
+# Firebase 스타일 push id (시간순 정렬되는 20자리 키)
+# ---------------------------------------------------------------------------
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = [0] * 12
+
+
+def generate_push_id():
+    global _last_push_time, _last_rand_chars
+
+    with _push_lock:
+        now = int(time.time() * 1000)
+        duplicate_time = now == _last_push_time
+        _last_push_time = now
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        push_id = "".join(reversed(time_chars))
+
+        if not duplicate_time:
+            _last_rand_chars = [random.randrange(64) for _ in range(12)]
+        else:
+            # 같은 ms 안에서 만든 키도 순서가 유지되도록 1 증가
+            i = 11
+            while i >= 0 and _last_rand_chars[i] == 63:
+                _last_rand_chars[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_rand_chars[i] += 1
+
+        return push_id + "".join(PUSH_CHARS[n] for n in _last_rand_chars)
+
+
+def push_id_cursor(timestamp):
+    """timestamp(초) 이후에 만들어진 push id 가 모두 뒤에 오는 커서 (시간 부분 + 가장 작은 글자)"""
+    now = int(timestamp * 1000)
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(PUSH_CHARS[now % 64])
+        now //= 64
+    return "".join(reversed(time_chars)) + PUSH_CHARS[0] * 12
+
+
+def increment(n):
+    """Firebase ServerValue.increment 와 같은 값 (REST: {".sv": {"increment": n}}).
+
+    update() 에 넣으면 저장소 쪽에서 현재 값에 n 을 더하므로 읽고-쓰기 경쟁이 없다.
+    """
+    return {".sv": {"increment": n}}
+
+
+def _increment_of(value):
+    if isinstance(value, dict) and list(value) == [".sv"]:
+        sv = value[".sv"]
+        if isinstance(sv, dict) and "increment" in sv:
+            return sv["increment"]
+    return None
+
+
+def _etag(value):
+    # Firebase 의 ETag 처럼 값이 같으면 같은 문자열
+    return hashlib.md5(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# pyrebase 응답 객체 흉내
+# ---------------------------------------------------------------------------
+class SQLiteResponse:
+    def __init__(self, value, key=None):
+        self._value = value
+        self._key = key
+
+    def val(self):
+        return self._value
+
+    def key(self):
+        return self._key
+
+    def each(self):
+        if not isinstance(self._value, dict):
+            return []
+        return [SQLiteResponse(v, k) for k, v in self._value.items()]
+
+
+class SQLiteRef:
+    """db.child("a").child("b") 처럼 경로를 쌓아가는 참조 객체.
+
+    pyrebase와 달리 child()가 새 객체를 돌려주므로 여러 스레드에서 같이 써도 된다.
+    """
+
+    def __init__(self, store, parts=(), query=None):
+        self._store = store
+        self._parts = tuple(parts)
+        self._query = query or {}
+
+    def child(self, *args):
+        parts = list(self._parts)
+        for arg in args:
+            parts.extend(p for p in str(arg).split("/") if p)
+        return SQLiteRef(self._store, parts)
+
+    # --- 쿼리 (pyrebase의 order_by_child(...).equal_to(...) 등과 같은 모양) ---
+    def _with(self, **query):
+        return SQLiteRef(self._store, self._parts, dict(self._query, **query))
+
+    def order_by_child(self, field):
+        if not _NODE_NAME.match(field):
+            raise ValueError(f"잘못된 필드 이름: {field!r}")
+        return self._with(order_by=field)
+
+    def order_by_key(self):
+        return self._with(order_by="$key")
+
+    def equal_to(self, value):
+        return self._with(equal_to=value)
+
+    def start_at(self, value):
+        return self._with(start_at=value)
+
+    def end_at(self, value):
+        return self._with(end_at=value)
+
+    def limit_to_first(self, n):
+        return self._with(limit_to_first=int(n))
+
+    def limit_to_last(self, n):
+        return self._with(limit_to_last=int(n))
+
+    def get(self):
+        key = self._parts[-1] if self._parts else None
+        return SQLiteResponse(self._store.read(self._parts, self._query), key)
+
+    def set(self, data):
+        self._store.write({self._parts: data})
+        return data
+
+    def update(self, data):
+        # {"a/b": 1, "c": 2} 처럼 여러 하위 경로를 한 트랜잭션으로 갱신
+        writes = {}
+        for path, value in data.items():
+            writes[self._parts + tuple(p for p in str(path).split("/") if p)] = value
+        self._store.write(writes)
+        return data
+
+    def push(self, data):
+        key = generate_push_id()
+        self._store.write({self._parts + (key,): data})
+        return {"name": key}
+
+    def remove(self):
+        self._store.write({self._parts: None})
+
+    # --- pyrebase4 의 ETag 조건부 쓰기 (비어 있을 때만 만들기 등) ---
+    def get_etag(self):
+        value = self._store.read(self._parts)
+        return {"ETag": _etag(value), "value": value}
+
+    def conditional_set(self, data, etag):
+        """etag 가 지금 값과 같을 때만 set. 다르면 pyrebase 처럼 {"ETag", "value"} 를 돌려준다"""
+        with self._store._lock:
+            current = self._store.read(self._parts)
+            if _etag(current) != etag:
+                return {"ETag": _etag(current), "value": current}
+            self._store.write({self._parts: data})
+        return data
+
+
+# ---------------------------------------------------------------------------
+# SQLite 저장소
+# ---------------------------------------------------------------------------
+def _node_spec(node):
+    if not _NODE_NAME.match(node):
+        raise ValueError(f"잘못된 노드 이름: {node!r}")
+    return NODES.get(node, DEFAULT_NODE)
+
+
+def _prune(value):
+    # Firebase처럼 None 과 빈 객체는 저장하지 않는다
+    if isinstance(value, dict):
+        pruned = {}
+        for k, v in value.items():
+            v = _prune(v)
+            if v is not None:
+                pruned[str(k)] = v
+        return pruned or None
+    return value
+
+
+def _flatten(value, levels):
+    # {k0: {k1: v}} → ((k0, k1), v) 목록
+    if levels == 0:
+        yield (), value
+        return
+    if not isinstance(value, dict):
+        raise ValueError("테이블 키 단계에는 객체(dict)만 저장할 수 있습니다.")
+    for k, v in value.items():
+        for sub_keys, leaf in _flatten(v, levels - 1):
+            yield (str(k),) + sub_keys, leaf
+
+
+def _set_in(doc, keys, value):
+    head, rest = keys[0], keys[1:]
+    if not rest:
+        if value is None:
+            doc.pop(head, None)
+        else:
+            doc[head] = value
+        return
+    child = doc.get(head)
+    if not isinstance(child, dict):
+        child = {}
+    _set_in(child, rest, value)
+    if child:
+        doc[head] = child
+    else:
+        doc.pop(head, None)
+
+
+def _sort_value(value):
+    # Firebase 정렬 순서: null < bool < 숫자 < 문자열 < 객체
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, json.dumps(value, sort_keys=True))
+
+
+def _apply_query(tree, query):
+    # 행 단위가 아닌 경로에 쿼리를 건 경우: 읽어온 dict 를 파이썬에서 거른다
+    if not isinstance(tree, dict):
+        return {}
+    order_by = query.get("order_by", "$key")
+
+    def position(kv):
+        if order_by == "$key":
+            return _sort_value(kv[0])
+        return _sort_value(kv[1].get(order_by) if isinstance(kv[1], dict) else None)
+
+    items = sorted(tree.items(), key=lambda kv: (position(kv), kv[0]))
+    if "equal_to" in query:
+        items = [kv for kv in items if position(kv) == _sort_value(query["equal_to"])]
+    if "start_at" in query:
+        items = [kv for kv in items if position(kv) >= _sort_value(query["start_at"])]
+    if "end_at" in query:
+        items = [kv for kv in items if position(kv) <= _sort_value(query["end_at"])]
+    if "limit_to_first" in query:
+        items = items[: query["limit_to_first"]]
+    if "limit_to_last" in query:
+        items = items[-query["limit_to_last"]:] if query["limit_to_last"] else []
+    return dict(items)
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        # sqlite 쓰기는 어차피 직렬화되므로 연결 하나를 lock으로 공유한다
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._tables = set()
+
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            for node in NODES:
+                self._ensure_table(node)
+
+    def root(self):
+        return SQLiteRef(self)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 테이블 관리 ---
+    def _ensure_table(self, node):
+        if node in self._tables:
+            return
+        spec = _node_spec(node)
+        key_cols = [f"k{i}" for i in range(spec["depth"])]
+        columns = ", ".join(f"{c} TEXT NOT NULL" for c in key_cols)
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{node}" '
+            f'({columns}, value TEXT NOT NULL, PRIMARY KEY ({", ".join(key_cols)}))'
+        )
+        for field in spec["indexes"]:
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{node}__{field}" '
+                f"ON \"{node}\" (json_extract(value, '$.{field}'))"
+            )
+        self._tables.add(node)
+
+    def _existing_nodes(self):
+        rows = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        return sorted(r[0] for r in rows)
+
+    @staticmethod
+    def _where(keys):
+        if not keys:
+            return "", ()
+        clause = " AND ".join(f"k{i} = ?" for i in range(len(keys)))
+        return f" WHERE {clause}", tuple(keys)
+
+    # --- 읽기 ---
+    def read(self, parts, query=None):
+        with self._lock:
+            if not parts:
+                tree = {}
+                for node in self._existing_nodes():
+                    value = self._read_node(node, ())
+                    if value is not None:
+                        tree[node] = value
+                return _apply_query(tree, query) if query else (tree or None)
+            return self._read_node(parts[0], tuple(parts[1:]), query)
+
+    def _read_node(self, node, keys, query=None):
+        spec = _node_spec(node)
+        depth = spec["depth"]
+        if node not in self._tables and node not in self._existing_nodes():
+            return None
+        self._ensure_table(node)
+
+        if query and len(keys) == depth - 1:
+            # 자식 하나하나가 테이블 행인 경로 → 인덱스를 타는 SQL 로 처리
+            return self._query_rows(node, keys, depth, query)
+        if query:
+            return _apply_query(self._read_node(node, keys), query)
+
+        if len(keys) >= depth:
+            where, params = self._where(keys[:depth])
+            row = self._conn.execute(f'SELECT value FROM "{node}"{where}', params).fetchone()
+            if row is None:
+                return None
+            value = json.loads(row[0])
+            for key in keys[depth:]:
+                if not isinstance(value, dict) or key not in value:
+                    return None
+                value = value[key]
+            return value
+
+        key_cols = [f"k{i}" for i in range(depth)]
+        where, params = self._where(keys)
+        rows = self._conn.execute(
+            f'SELECT {", ".join(key_cols)}, value FROM "{node}"{where} '
+            f'ORDER BY {", ".join(key_cols)}',
+            params,
+        ).fetchall()
+        if not rows:
+            return None
+
+        tree = {}
+        for row in rows:
+            row_keys, value = row[len(keys):depth], json.loads(row[depth])
+            cursor = tree
+            for key in row_keys[:-1]:
+                cursor = cursor.setdefault(key, {})
+            cursor[row_keys[-1]] = value
+        return tree
+
+    def _query_rows(self, node, keys, depth, query):
+        key_col = f"k{depth - 1}"
+        order_by = query.get("order_by", "$key")
+        expr = key_col if order_by == "$key" else f"json_extract(value, '$.{order_by}')"
+
+        where, params = self._where(keys)
+        conds = [where[len(" WHERE "):]] if where else []
+        params = list(params)
+        for name, op in (("equal_to", "="), ("start_at", ">="), ("end_at", "<=")):
+            if name in query:
+                conds.append(f"{expr} {op} ?")
+                params.append(query[name])
+
+        sql = f'SELECT {key_col}, value FROM "{node}"'
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
+        if "limit_to_last" in query:
+            sql += f" ORDER BY {expr} DESC, {key_col} DESC LIMIT {query['limit_to_last']}"
+        else:
+            sql += f" ORDER BY {expr}, {key_col}"
+            if "limit_to_first" in query:
+                sql += f" LIMIT {query['limit_to_first']}"
+
+        rows = self._conn.execute(sql, params).fetchall()
+        if "limit_to_last" in query:
+            rows.reverse()
+        return {k: json.loads(v) for k, v in rows}
+
+    # --- 쓰기 ---
+    def write(self, writes):
+        """{경로 튜플: 값} 을 한 트랜잭션으로 반영 (값이 None 이면 삭제)"""
+        with self._lock, self._conn:
+            for parts, value in writes.items():
+                delta = _increment_of(value)
+                if delta is not None:
+                    current = self.read(parts)
+                    if isinstance(current, bool) or not isinstance(current, (int, float)):
+                        current = 0
+                    value = current + delta
+                value = _prune(value)
+                if not parts:
+                    for node in self._existing_nodes():
+                        self._conn.execute(f'DELETE FROM "{node}"')
+                    for node, sub in (value or {}).items():
+                        self._write_node(node, (), sub)
+                    continue
+                self._write_node(parts[0], tuple(parts[1:]), value)
+
+    def _write_node(self, node, keys, value):
+        spec = _node_spec(node)
+        depth = spec["depth"]
+        self._ensure_table(node)
+
+        if len(keys) < depth:
+            where, params = self._where(keys)
+            self._conn.execute(f'DELETE FROM "{node}"{where}', params)
+            if value is None:
+                return
+            for sub_keys, leaf in _flatten(value, depth - len(keys)):
+                self._put_row(node, keys + sub_keys, leaf)
+            return
+
+        row_keys = keys[:depth]
+        if len(keys) > depth:
+            # 한 행(JSON) 안쪽 경로를 고치는 경우: 읽고 → 고치고 → 다시 저장
+            where, params = self._where(row_keys)
+            row = self._conn.execute(f'SELECT value FROM "{node}"{where}', params).fetchone()
+            doc = json.loads(row[0]) if row else {}
+            if not isinstance(doc, dict):
+                doc = {}
+            _set_in(doc, keys[depth:], value)
+            value = doc or None
+
+        if value is None:
+            where, params = self._where(row_keys)
+            self._conn.execute(f'DELETE FROM "{node}"{where}', params)
+        else:
+            self._put_row(node, row_keys, value)
+
+    def _put_row(self, node, keys, value):
+        cols = ", ".join(f"k{i}" for i in range(len(keys)))
+        marks = ", ".join("?" for _ in range(len(keys) + 1))
+        self._conn.execute(
+            f'INSERT OR REPLACE INTO "{node}" ({cols}, value) VALUES ({marks})',
+            tuple(keys) + (json.dumps(value, ensure_ascii=False),),
+        )
+
+
+class PerThreadPyrebase:
+    """pyrebase Database 를 스레드마다 하나씩 만들어 쓰는 얇은 래퍼.
+
+    pyrebase 의 child() 는 새 객체가 아니라 자기 자신의 path 를 이어붙이므로
+    여러 스레드가 한 객체를 같이 쓰면 경로가 섞인다.
+    """
+
+    def __init__(self, firebase):
+        self._firebase = firebase
+        self._local = threading.local()
+
+    def _database(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._firebase.database()
+        return db
+
+    def __getattr__(self, name):
+        return getattr(self._database(), name)
+
+
+def connect(backend, firebase_config=None, sqlite_path=None, http_session=None):
+    """config.DB_BACKEND 값에 맞는 pyrebase 호환 db 객체를 돌려준다."""
+    if backend == "firebase":
+        import pyrebase
+
+        firebase = pyrebase.initialize_app(firebase_config)
+        if http_session is not None:
+            # 모든 Database 객체가 firebase.requests 를 같이 쓰므로 여기서 바꿔 끼운다
+            firebase.requests.close()
+            firebase.requests = http_session
+        return PerThreadPyrebase(firebase)
+    if backend == "sqlite":
+        return SQLiteBackend(sqlite_path or ":memory:").root()
+    raise ValueError(f"알 수 없는 DB_BACKEND: {backend!r}")
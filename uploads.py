@@ -0,0 +1,142 @@
+"""업로드 파일 저장.
+
+FileStorage.save() 는 크기/형식 확인 없이 통째로 저장한다. 여기서는 업로드
+스트림을 조금씩 읽어 같은 폴더의 임시 파일에 쓰면서 크기를 확인하고, 첫
+몇 바이트(매직 바이트)로 실제 이미지 형식을 확인한 뒤, 다 쓰면 최종 이름으로
+한 번에 옮긴다(os.replace). 도중에 실패하면 임시 파일은 지운다.
+
+요청 전체 크기는 app.config["MAX_CONTENT_LENGTH"] 로 막히므로(413), 너무 큰
+요청은 본문을 다 읽기 전에 거절된다.
+
+파일 이름은 내용의 sha256 (예: 3f2a...e1.jpg) 이라서 같은 사진을 다시 올리면
+새로 저장하지 않고 이미 있는 파일을 그대로 쓴다. 어느 상품/리뷰/대화가 어떤
+파일을 쓰는지는 DB 의 image_refs 에 기록하고, 마지막 참조가 사라지면
+remove_image() 로 지운다.
+
+참조 확인과 파일 삭제 사이에 다른 요청(다른 워커 프로세스 포함)이 같은 내용을
+다시 올려 그 파일을 재사용할 수 있다. 그래서 재사용할 때 파일 수정 시각을 새로
+찍고, remove_image() 는 min_age 초보다 최근에 쓰인 파일은 지우지 않는다. 그렇게
+남은 파일은 나중에 flask gc-images 가 치운다.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+# 매직 바이트 → 저장할 확장자
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+# 내용 해시로 만든 이름 (예전 uuid 이름은 32자라 구분된다)
+CONTENT_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+
+
+class UploadError(ValueError):
+    """사용자에게 그대로 보여줄 수 있는 메시지를 가진 업로드 오류"""
+
+
+def sniff_image_type(head):
+    """파일 앞부분으로 이미지 확장자를 판별 (이미지가 아니면 None)"""
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def save_image(file, dest_dir, max_bytes):
+    """업로드된 이미지 하나를 dest_dir 에 저장하고 파일 이름을 반환"""
+    return _store_image(file, dest_dir, max_bytes)[0]
+
+
+def _store_image(file, dest_dir, max_bytes):
+    # (파일 이름, 새로 만들었는지)
+    os.makedirs(dest_dir, exist_ok=True)
+    stream = file.stream
+    head = stream.read(CHUNK_SIZE)
+    ext = sniff_image_type(head)
+    if ext is None:
+        raise UploadError(f"이미지 파일만 올릴 수 있습니다: {file.filename}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".tmp")
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(
+                        f"파일이 너무 큽니다 (최대 {max_bytes / (1024 * 1024):.3g}MB): {file.filename}"
+                    )
+                out.write(chunk)
+                digest.update(chunk)
+                chunk = stream.read(CHUNK_SIZE)
+
+        name = f"{digest.hexdigest()}{ext}"
+        dest = os.path.join(dest_dir, name)
+        if os.path.exists(dest):
+            # 같은 내용이 이미 있음: 방금 쓰인 파일로 표시해서 remove_image 가 유예하게
+            try:
+                os.utime(dest)
+            except FileNotFoundError:
+                pass  # 그 사이 지워졌으면 아래에서 새로 만든다
+            else:
+                os.remove(tmp_path)
+                return name, False
+        os.replace(tmp_path, dest)
+        return name, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_images(files, dest_dir, max_bytes, max_count):
+    """여러 장 저장. 하나라도 실패하면 이미 저장한 것도 지우고 UploadError"""
+    files = [f for f in files if f and f.filename]
+    if len(files) > max_count:
+        raise UploadError(f"사진은 최대 {max_count}장까지 올릴 수 있습니다.")
+
+    saved = []
+    created = []
+    try:
+        for f in files:
+            name, new = _store_image(f, dest_dir, max_bytes)
+            if name not in saved:
+                saved.append(name)
+            if new:
+                created.append(name)
+    except UploadError:
+        # 이번 요청에서 새로 만든 파일만 지운다 (원래 있던 파일은 다른 곳에서 쓰는 중)
+        for name in created:
+            os.remove(os.path.join(dest_dir, name))
+        raise
+    return saved
+
+
+def remove_image(static_dir, path, min_age=0):
+    """static 기준 경로(images/abc.jpg)의 파일을 지운다. 해시 이름 파일만 지움
+
+    min_age 초 안에 올라왔거나 재사용된 파일은 지우지 않는다 (False).
+    """
+    if not CONTENT_NAME.match(os.path.basename(path)):
+        return False
+    full = os.path.join(static_dir, path)
+    try:
+        if min_age and time.time() - os.path.getmtime(full) < min_age:
+            return False
+        os.remove(full)
+    except FileNotFoundError:
+        return False
+    return True
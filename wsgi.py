@@ -0,0 +1,20 @@
+"""운영 서버 진입점 (WSGI).
+
+    gunicorn -c gunicorn.conf.py wsgi:application      # 리눅스, 여러 워커 프로세스
+    python wsgi.py                                      # waitress (윈도우 등, 한 프로세스)
+
+waitress 는 연결마다 스레드를 쓰므로 열린 채팅 스트림이 WEB_THREADS 개를 넘으면
+다른 요청이 밀린다. 사람이 많으면 gunicorn(gevent 워커)으로 띄운다.
+
+개발할 때는 예전처럼 python app.py (debug 서버) 로 실행한다.
+"""
+import config as app_config
+from app import create_app
+
+application = create_app()
+
+if __name__ == "__main__":
+    from waitress import serve
+
+    host, _, port = app_config.WEB_BIND.rpartition(":")
+    serve(application, host=host or "0.0.0.0", port=int(port), threads=app_config.WEB_THREADS)